@@ -31,7 +31,49 @@
 # Thanks to Jose Jachuf, who provided the titleband implementation and
 # the initial version of the Image class, and who implemented Unicode support.
 
-from reportlab.lib.utils import simpleSplit
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import weakref
+
+from collections import OrderedDict
+from decimal import Decimal
+from functools import reduce
+from operator import add, itemgetter
+
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.colors import black
+from reportlab.pdfgen.canvas import Canvas, FILL_NON_ZERO
+from reportlab.rl_config import defaultPageSize
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from pypdf import PdfReader
+    from pypdf.generic import ArrayObject, DictionaryObject, \
+        IndirectObject, NameObject, NumberObject, StreamObject
+except ImportError:
+    PdfReader = None
 
 
 """
@@ -54,7 +96,13 @@ from reportlab.lib.utils import simpleSplit
 """
 
 
+# Renderers are created for every Element of every row, so they use
+# __slots__ to keep them small and quick to create.
+
 class BaseRenderer(object):
+
+    __slots__ = ("parent", "pos", "onrender")
+
     def __init__(self, parent=None, pos=None, onrender=None):
         self.parent = parent
         self.pos = pos or (0,0)
@@ -68,8 +116,487 @@ class BaseRenderer(object):
         self.pos = (self.pos[0], self.pos[1] + offset)
         return self
 
+_unicode = type(u"")
+
+
+# Width tables.  Reportlab's stringWidth() looks up the font and
+# encodes the text every time it is called; here the character
+# widths of each font are gathered once, into a dict mapping each
+# character to its width, and stringwidth() just sums them.  The
+# arithmetic is done exactly as Reportlab does it, so the results
+# are identical; anything the table doesn't cover (characters
+# outside the font's encoding, CID fonts) is handed to Reportlab.
+
+_widthtables = {}
+
+def _widthtable(fontname):
+    if fontname in _widthtables:
+        return _widthtables[fontname]
+    font = pdfmetrics.getFont(fontname)
+    table = None
+    if isinstance(font, TTFont):
+        table = ("ttf", font.face.charWidths, font.face.defaultWidth, None)
+    elif type(font) is pdfmetrics.Font and "UCS-2" not in font.encName:
+        widths = {}
+        for code in range(256):
+            try:
+                char = bytearray([code]).decode(font.encName)
+                if char.encode(font.encName) != bytes(bytearray([code])):
+                    continue
+            except UnicodeError:
+                continue
+            widths[char] = font.widths[code]
+        if numpy is not None:
+            array = numpy.array(font.widths, dtype = numpy.int64)
+        else:
+            array = None
+        table = ("t1", widths, font.encName, array)
+    _widthtables[fontname] = table
+    return table
+
+
+def stringwidth(text, fontname, size):
+    if not isinstance(text, _unicode):
+        text = text.decode("utf8")
+    table = _widthtable(fontname)
+    if table is not None:
+        if table[0] == "t1":
+            try:
+                return sum(map(table[1].__getitem__, text)) * 0.001 * size
+            except KeyError:
+                pass
+        else:
+            get = table[1].get
+            default = table[2]
+            return 0.001 * size * sum([ get(ord(c), default) for c in text ])
+    return pdfmetrics.stringWidth(text, fontname, size)
+
+
+# stringwidths() measures a whole list of strings in one call.
+# For longer lists in Type 1 fonts, when NumPy is available, all the
+# strings are encoded into one array of character codes and summed
+# at once; otherwise it is the same as calling stringwidth() on each.
+
+_numpyminimum = 32
+
+def stringwidths(texts, fontname, size):
+    table = _widthtable(fontname)
+    if len(texts) < _numpyminimum or table is None or table[3] is None:
+        return [ stringwidth(text, fontname, size) for text in texts ]
+    texts = [ text if isinstance(text, _unicode) else text.decode("utf8")
+        for text in texts ]
+    try:
+        encoded = u"".join(texts).encode(table[2])
+    except UnicodeError:
+        return [ stringwidth(text, fontname, size) for text in texts ]
+    # Type 1 encodings are one byte per character
+    ends = numpy.cumsum([ len(text) for text in texts ])
+    if len(encoded) != (ends[-1] if len(texts) else 0):
+        return [ stringwidth(text, fontname, size) for text in texts ]
+    codes = numpy.frombuffer(encoded, dtype = numpy.uint8)
+    sums = numpy.concatenate(([ 0 ], numpy.cumsum(table[3][codes])))
+    starts = numpy.concatenate(([ 0 ], ends[:-1]))
+    return [ total * 0.001 * size
+        for total in (sums[ends] - sums[starts]).tolist() ]
+
+
+# wraptext() splits text into lines no wider than width, in the same
+# way as Reportlab's simpleSplit(), but measuring each line's words
+# with a single call to stringwidths().
+
+def wraptext(text, fontname, size, width):
+    if not isinstance(text, _unicode):
+        text = text.decode("utf8")
+    lines = text.split(u"\n")
+    if not width:
+        return lines
+    result = []
+    space = stringwidth(u" ", fontname, size)
+    for line in lines:
+        words = line.split()
+        current = []
+        total = -space
+        for word, wordwidth in zip(words, stringwidths(words, fontname, size)):
+            if total + space + wordwidth <= width or not current:
+                current.append(word)
+                total = total + space + wordwidth
+            else:
+                result.append(u" ".join(current))
+                current = [ word ]
+                total = wordwidth
+        if current:
+            result.append(u" ".join(current))
+    return result
+
+
+# _drawstring() draws text at the given position the way Reportlab's
+# Canvas.drawString() does, but without drawString() measuring the
+# text (which it does even though it doesn't need to); it is only
+# used on real Reportlab canvases.
+
+def _drawstring(canvas, x, y, text):
+    textobject = canvas.beginText(x, y)
+    textobject.textLine(text)
+    canvas.drawText(textobject)
+
+
+# PageBatch collects the text drawn on a page (see Report.batching)
+# in place of the canvas, grouped by font and fill color, and draws it
+# all at once, in a single text object, when the page is finished.
+# setfont() and drawstring() stand in for canvas.setFont() and
+# _drawstring().
+#
+# Rules, shapes, and the forms used for bands and images, are collected
+# as well, and drawn before the text.  Lines and rectangles drawn with
+# the same line width, colors and painting operation are gathered into
+# a single path, and drawn with one fill or stroke.  So that shapes
+# are still drawn over whatever they were drawn over before, a shape
+# only joins an earlier group if it doesn't overlap any shape which
+# was collected after that group was begun; otherwise it begins a new
+# group.  Each group is (key, items, bounding boxes).  A shape which
+# overlaps text already collected must be drawn over it, so the batch
+# is flushed first; the text boxes are kept in horizontal strips of
+# _STRIP points, so only the text near the shape need be checked.
+# Anything drawn directly on the canvas must flush the batch first.
+
+class PageBatch(object):
+
+    _STRIP = 32
+
+    def __init__(self):
+        self._groups = OrderedDict()
+        self._current = None
+        self._font = None
+        self._extents = {}
+        self._text = {}
+        self._shapes = []
+        self._latest = {}
+
+    def rect(self, canvas, state, x, y, width, height, stroke, fill):
+        key = ("path", state, stroke and 1 or 0, fill and 1 or 0)
+        box = (min(x, x + width), min(y, y + height),
+               max(x, x + width), max(y, y + height))
+        self._add(canvas, key, box, ("rect", x, y, width, height))
+
+    def line(self, canvas, state, x1, y1, x2, y2):
+        pad = 0.5 * state[0]
+        box = (min(x1, x2) - pad, min(y1, y2) - pad,
+               max(x1, x2) + pad, max(y1, y2) + pad)
+        self._add(canvas, ("path", state, 1, 0), box, ("line", x1, y1, x2, y2))
+
+    # doform() draws the named form with the given transformation
+    # matrix; box is the area it covers, in page coordinates.
+
+    def doform(self, canvas, name, matrix, box):
+        self._add(canvas, ("form", name), box, matrix)
+
+    # before() is called before drawing directly on the canvas over
+    # box (or anywhere, if box is None), so that whatever has been
+    # collected is drawn beneath it.
+
+    def before(self, canvas, box = None):
+        if box is None or self._overlapstext(box):
+            self.flush(canvas)
+        else:
+            self.flushshapes(canvas)
+
+    def _overlapstext(self, box):
+        x0, y0, x1, y1 = box
+        strip = self._STRIP
+        for i in range(int(y0 // strip), int(y1 // strip) + 1):
+            for bx0, by0, bx1, by1 in self._text.get(i, ()):
+                if x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1:
+                    return True
+        return False
+
+    def _add(self, canvas, key, box, item):
+        if self._text and self._overlapstext(box):
+            self.flush(canvas)
+        index = self._latest.get(key)
+        if index is not None:
+            x0, y0, x1, y1 = box
+            for later in range(index + 1, len(self._shapes)):
+                for bx0, by0, bx1, by1 in self._shapes[later][2]:
+                    if x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1:
+                        index = None
+                        break
+                if index is None:
+                    break
+        if index is None:
+            index = len(self._shapes)
+            self._shapes.append((key, [], []))
+            self._latest[key] = index
+        group = self._shapes[index]
+        group[1].append(item)
+        group[2].append(box)
+
+    def flushshapes(self, canvas):
+        shapes = self._shapes
+        self._shapes = []
+        self._latest = {}
+        for key, items, boxes in shapes:
+            if key[0] == "form":
+                for matrix in items:
+                    canvas.saveState()
+                    canvas.transform(*matrix)
+                    canvas.doForm(key[1])
+                    canvas.restoreState()
+                continue
+            (linewidth, strokecolor, fillcolor), stroke, fill = key[1:]
+            canvas.saveState()
+            if stroke:
+                canvas.setLineWidth(linewidth)
+                canvas.setStrokeColor(strokecolor)
+            if fill:
+                canvas.setFillColor(fillcolor)
+            path = canvas.beginPath()
+            for item in items:
+                if item[0] == "rect":
+                    path.rect(item[1], item[2], item[3], item[4])
+                else:
+                    path.moveTo(item[1], item[2])
+                    path.lineTo(item[3], item[4])
+            canvas.drawPath(path, stroke = stroke, fill = fill,
+                fillMode = FILL_NON_ZERO)
+            canvas.restoreState()
+
+    def setfont(self, canvas, font):
+        key = (font[0], font[1], canvas._fillColorObj)
+        extent = self._extents.get(font)
+        if extent is None:
+            # how far the font's glyphs reach above and below the baseline
+            extent = self._extents[font] = (
+                pdfmetrics.getAscent(font[0], font[1]),
+                pdfmetrics.getDescent(font[0], font[1]))
+        self._font = font + extent
+        self._current = self._groups.get(key)
+        if self._current is None:
+            self._current = self._groups[key] = []
+
+    def drawstring(self, canvas, x, y, text):
+        if text:
+            self._current.append((x, y, text))
+            fontname, size, ascent, descent = self._font
+            box = (x, y + descent,
+                x + stringwidth(text, fontname, size), y + ascent)
+            strip = self._STRIP
+            for i in range(int(box[1] // strip), int(box[3] // strip) + 1):
+                strips = self._text.get(i)
+                if strips is None:
+                    strips = self._text[i] = []
+                strips.append(box)
+
+    def flush(self, canvas):
+        self.flushshapes(canvas)
+        groups = self._groups
+        self._groups = OrderedDict()
+        self._current = None
+        self._text = {}
+        if not groups:
+            return
+        canvas.saveState()
+        color = canvas._fillColorObj
+        textobject = canvas.beginText()
+        for (fontname, size, fillcolor), items in groups.items():
+            if not items:
+                continue
+            textobject.setFont(fontname, size)
+            if fillcolor != color:
+                textobject.setFillColor(fillcolor)
+                color = fillcolor
+            for x, y, text in items:
+                textobject.setTextOrigin(x, y)
+                textobject.textLine(text)
+        canvas.drawText(textobject)
+        canvas.restoreState()
+
+
+# WrapCache remembers the lines that wraptext() has produced
+# for a given font, width and text, so that text which repeats
+# from row to row (descriptions, labels and so on) is only wrapped
+# once.  At most maxsize entries are kept, the least recently used
+# being discarded first (or all of them, if maxsize is None); hits
+# and misses count the lookups, and may be used to tune maxsize.
+
+class WrapCache(object):
+
+    def __init__(self, maxsize = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lines = OrderedDict()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def split(self, text, font, width):
+        key = (font[0], font[1], width, text)
+        lines = self._lines.pop(key, None)
+        if lines is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            lines = wraptext(text, font[0], font[1], width)
+            while self._lines and self.maxsize is not None \
+            and len(self._lines) >= self.maxsize:
+                self._lines.popitem(last = False)
+        if self.maxsize is None or self.maxsize > 0:
+            self._lines[key] = lines
+        return lines
+
+    def clear(self):
+        self._lines.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# MemoCache holds the results of format functions (and of getvalue
+# functions declared pure) for those TextElements which set memoize,
+# so that a value which repeats is only formatted (and wrapped) once.
+# Each such element has a memo of its own, holding no more than the
+# element's memoize entries, the least recently used being discarded
+# first; all of them together are kept within maxbytes, the largest
+# memo giving up its least recently used entry when more room is
+# needed.  An element's memo is started afresh whenever the element
+# changes (see TextElement.signature()).
+
+class MemoCache(object):
+
+    def __init__(self, maxbytes = 4 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # memos are kept by id(owner), and each holds only a weak
+        # reference to its owner, so a memo never keeps an element
+        # (or its Report and datasource) alive; it is dropped, and
+        # its bytes given back, when the element goes away.
+        self._memos = {}
+
+    def __len__(self):
+        return sum(len(memo.entries) for memo in self._memos.values())
+
+    # memo() returns the memo for owner (an element), which holds
+    # values worked out on the given basis.
+
+    def memo(self, owner, basis, maxsize):
+        key = id(owner)
+        memo = self._memos.get(key)
+        if memo is None or memo.basis != basis or memo.maxsize != maxsize:
+            if memo is not None:
+                # anything still using the old memo stops storing in it
+                memo.maxsize = 0
+                memo.entries.clear()
+                self.bytes -= memo.bytes
+                memo.bytes = 0
+            memo = self._memos[key] = _Memo(self, basis, maxsize)
+            memo.owner = weakref.ref(owner,
+                lambda ref, key = key: self._release(key, ref))
+        return memo
+
+    def _release(self, key, ref):
+        memo = self._memos.get(key)
+        if memo is not None and memo.owner is ref:
+            del self._memos[key]
+            memo.maxsize = 0
+            memo.entries.clear()
+            self.bytes -= memo.bytes
+            memo.bytes = 0
+
+    def clear(self):
+        for memo in self._memos.values():
+            memo.entries.clear()
+            memo.bytes = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class _Memo(object):
+
+    __slots__ = ("cache", "owner", "basis", "maxsize", "bytes", "entries")
+
+    def __init__(self, cache, basis, maxsize):
+        self.cache = cache
+        self.owner = None
+        self.basis = basis
+        self.maxsize = maxsize
+        self.bytes = 0
+        self.entries = OrderedDict()
+
+    # get() returns the result stored under key, or else
+    # function(argument), which it stores.  Keys which can't be
+    # hashed are simply not memoized.
+
+    def get(self, key, function, argument):
+        cache = self.cache
+        try:
+            entry = self.entries.pop(key, None)
+        except TypeError:
+            return function(argument)
+        if entry is not None:
+            cache.hits += 1
+            self.entries[key] = entry
+            return entry[0]
+        cache.misses += 1
+        result = function(argument)
+        size = _memosize(key, result)
+        if size > cache.maxbytes or self.maxsize < 1:
+            return result
+        while len(self.entries) >= self.maxsize:
+            self.discard()
+        while cache.bytes + size > cache.maxbytes:
+            max(cache._memos.values(), key = lambda memo: memo.bytes).discard()
+        self.entries[key] = (result, size)
+        self.bytes += size
+        cache.bytes += size
+        return result
+
+    def discard(self):
+        key, entry = self.entries.popitem(last = False)
+        self.bytes -= entry[1]
+        self.cache.bytes -= entry[1]
+        self.cache.evictions += 1
+
+
+# _memokey() returns the key under which a value (or, for a pure
+# getvalue function, a row) is memoized.  Values which compare equal
+# but may format differently (1 and 1.0, Decimal("1.0") and
+# Decimal("1.00"), times in different time zones) get different keys.
+
+def _memokey(value):
+    if isinstance(value, (float, complex, Decimal)):
+        return (type(value), repr(value))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_memokey(item) for item in value))
+    if hasattr(value, "keys") and hasattr(value, "__getitem__"):
+        return (None, tuple((key, _memokey(value[key]))
+            for key in value.keys()))
+    return (type(value), value, getattr(value, "tzinfo", None))
+
+
+# _memosize() estimates the memory taken by a memo entry, counting
+# the key's outer tuple, the text (or lines) stored, and the
+# OrderedDict's own overhead.
+
+def _memosize(key, result):
+    size = sys.getsizeof(key) + sys.getsizeof(result) + 200
+    if isinstance(result, (list, tuple)):
+        size += sum(sys.getsizeof(line) for line in result)
+    return size
+
+
 class TextRenderer(BaseRenderer):
 
+    __slots__ = ("font", "align", "lineheight", "width", "lines", "height")
+
+    # wrapcache may be replaced with a larger (or smaller) WrapCache,
+    # or set to None to disable caching.
+
+    wrapcache = WrapCache()
+
     def __init__(self, font, text, align, height, width, **kwargs):
         BaseRenderer.__init__(self, **kwargs)
         self.font = font
@@ -78,9 +605,11 @@ class TextRenderer(BaseRenderer):
         self.width = width
 
         if self.width is None:
-            self.lines = text.split("\n")
+            self.lines = text.split("\n") if "\n" in text else (text,)
         else:
-            self.lines = simpleSplit(text, *self.font, maxWidth=self.width)
+            report = getattr(self.parent, "report", None)
+            wrap = _wrap if report is None else report._wrap
+            self.lines = wrap(text, self.font, self.width)
 
         self.height = height * len(self.lines)
 
@@ -88,30 +617,173 @@ class TextRenderer(BaseRenderer):
         BaseRenderer.render(self, offset, canvas)
 
         leftmargin = self.parent.report.leftmargin
-        canvas.setFont(*self.font)
+        fasttext = self.parent.report._reportlab
+        batch = self.parent.report._batch
+        if batch is not None:
+            batch.setfont(canvas, self.font)
+            drawstring = batch.drawstring
+        else:
+            canvas.setFont(*self.font)
+            drawstring = _drawstring
         for text in self.lines:
             if "right".startswith(self.align):
-                canvas.drawRightString(
-                    self.pos[0]+leftmargin,
-                    (-1) * (self.pos[1]+offset+self.font[1]),
-                    text)
+                if fasttext:
+                    drawstring(canvas,
+                        self.pos[0]+leftmargin-stringwidth(text, *self.font),
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
+                else:
+                    canvas.drawRightString(
+                        self.pos[0]+leftmargin,
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
             elif "center".startswith(self.align) or "centre".startswith(self.align):
-                canvas.drawCentredString(
-                    self.pos[0]+leftmargin,
-                    (-1) * (self.pos[1]+offset+self.font[1]),
-                    text)
+                if fasttext:
+                    drawstring(canvas,
+                        self.pos[0]+leftmargin-0.5*stringwidth(text, *self.font),
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
+                else:
+                    canvas.drawCentredString(
+                        self.pos[0]+leftmargin,
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
             elif "left".startswith(self.align):
-                canvas.drawString(
-                    self.pos[0]+leftmargin,
-                    (-1) * (self.pos[1]+offset+self.font[1]),
-                    text)
+                if fasttext:
+                    drawstring(canvas,
+                        self.pos[0]+leftmargin,
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
+                else:
+                    canvas.drawString(
+                        self.pos[0]+leftmargin,
+                        (-1) * (self.pos[1]+offset+self.font[1]),
+                        text)
             elif "align".startswith(self.align):
+                if batch is not None:
+                    batch.before(canvas)
+                    canvas.setFont(*self.font)
                 canvas.drawAlignedString(
                     self.pos[0]+leftmargin,
                     (-1) * (self.pos[1]+offset+self.font[1]),
                     text)
             offset += self.lineheight
 
+
+# the text drawing functions used by compiled TextElements (see
+# TextElement.compile()) on canvases other than real Reportlab
+# canvases, one per alignment, each called as draw(canvas, x, y, text).
+# On real canvases, text is drawn with _drawstring() (or added to the
+# PageBatch) after being shifted left by a fraction of its width: 0
+# for left-aligned text, 0.5 for centred text, 1 for right-aligned.
+
+def _canvasleft(canvas, x, y, text):
+    canvas.drawString(x, y, text)
+
+def _canvasright(canvas, x, y, text):
+    canvas.drawRightString(x, y, text)
+
+def _canvascentre(canvas, x, y, text):
+    canvas.drawCentredString(x, y, text)
+
+def _canvasaligned(canvas, x, y, text):
+    canvas.drawAlignedString(x, y, text)
+
+def _drawnothing(canvas, x, y, text):
+    pass
+
+# _textdrawer() returns (draw, shift) for the given alignment; shift
+# is None if text must be drawn with draw().
+
+def _textdrawer(align, fasttext):
+    # the same tests, in the same order, as TextRenderer.render()
+    if "right".startswith(align):
+        return _canvasright, 1 if fasttext else None
+    if "center".startswith(align) or "centre".startswith(align):
+        return _canvascentre, 0.5 if fasttext else None
+    if "left".startswith(align):
+        return _canvasleft, 0 if fasttext else None
+    if "align".startswith(align):
+        return _canvasaligned, None
+    return _drawnothing, None
+
+
+# _CompiledTextRenderer is the Renderer produced by a compiled
+# TextElement.  Everything which is the same for every row (font,
+# alignment, line height, width, left margin and how to draw)
+# comes ready-made in a plan tuple shared by all of the element's
+# renderers, so rendering does no lookups or alignment tests, and
+# each renderer holds only what varies.
+
+# _wrap() wraps text as a TextRenderer does outside a report run;
+# during a run, the Report's own _wrap (see Report._instrument())
+# is used instead.
+
+def _wrap(text, font, width):
+    if TextRenderer.wrapcache is not None:
+        return TextRenderer.wrapcache.split(text, font, width)
+    return wraptext(text, font[0], font[1], width)
+
+
+class _CompiledTextRenderer(BaseRenderer):
+
+    __slots__ = ("lines", "height", "plan")
+
+    def __init__(self, parent, plan, lines):
+        self.parent = parent
+        self.pos = parent.pos
+        self.onrender = parent.onrender
+        self.lines = lines
+        self.height = plan[2] * len(lines)
+        self.plan = plan
+
+    font = property(lambda self: self.plan[0])
+    align = property(lambda self: self.plan[1])
+    lineheight = property(lambda self: self.plan[2])
+    width = property(lambda self: self.plan[3])
+
+    def render(self, offset, canvas):
+        if self.onrender is not None:
+            self.onrender(self)
+        font, align, lineheight, width, leftmargin, draw, shift = self.plan
+        x = self.pos[0] + leftmargin
+        if shift is None:
+            batch = self.parent.report._batch
+            if batch is not None:
+                batch.before(canvas)
+            canvas.setFont(*font)
+            for text in self.lines:
+                draw(canvas, x, (-1) * (self.pos[1]+offset+font[1]), text)
+                offset += lineheight
+            return
+        batch = self.parent.report._batch
+        if batch is not None:
+            batch.setfont(canvas, font)
+            drawstring = batch.drawstring
+        else:
+            canvas.setFont(*font)
+            drawstring = _drawstring
+        for text in self.lines:
+            y = (-1) * (self.pos[1]+offset+font[1])
+            if shift:
+                drawstring(canvas,
+                    x-shift*stringwidth(text, font[0], font[1]), y, text)
+            else:
+                drawstring(canvas, x, y, text)
+            offset += lineheight
+
+
+# _overrides() is true if element's class replaces any of the named
+# methods of cls; such a subclass may print something different on
+# every row, however it is set up, so it is never taken as static.
+
+def _overrides(element, cls, names):
+    for name in names:
+        if getattr(type(element), name) != getattr(cls, name):
+            return True
+    return False
+
+
 class BaseElement(object):
 
     def __init__(self, pos=None, onrender = None):
@@ -130,10 +802,15 @@ class TextElement(BaseElement):
     # all three should not be submitted at the same time,
     #   but if they are, getvalue overrides key overrides text.
 
+    # memocache holds the memos of the elements which set memoize;
+    # it may be replaced with a MemoCache of a different size.
+
+    memocache = MemoCache()
+
     def __init__(self, pos, font, text = None,
                  key = None, getvalue = None, sysvar = None,
                  align = "left", format = str, width = None,
-                 leading = None, **kwargs):
+                 leading = None, memoize = 0, pure = 0, **kwargs):
         BaseElement.__init__(self, pos, **kwargs)
         self.text = text
         self.key = key
@@ -148,15 +825,52 @@ class TextElement(BaseElement):
         else:
             self.leading = max(1, int(font[1] * 0.4 + 0.5))
 
+        # memoize is the number of formatted values to remember (see
+        # MemoCache, above); pure means getvalue depends only on the row,
+        # so the text can be remembered for each row instead.
+        self.memoize = memoize
+        self.pure = pure
+
         self.report = None
         self.summary = 0 # used in SumElement, below
 
     def gettext(self, row):
+        if self.memoize:
+            return self._memogettext(row)
         value = self.getvalue(row)
         if value is None:
             return ""
         return self._format(value)
 
+    def _formatvalue(self, value):
+        if value is None:
+            return ""
+        return self._format(value)
+
+    # _memobasis() is what a memo's results depend on; it leaves out
+    # the Report, so a memo never holds on to a Report or its data.
+
+    def _memobasis(self):
+        return (self._format, self._getvalue, self.key, self.text,
+            self.sysvar, self.pure, TextElement.text_conversion)
+
+    def _memogettext(self, row):
+        memo = self.memocache.memo(self, self._memobasis(), self.memoize)
+        if self._ispure():
+            return memo.get(_memokey(row), self._unmemoizedtext, row)
+        value = self.getvalue(row)
+        return memo.get(_memokey(value), self._formatvalue, value)
+
+    def _unmemoizedtext(self, row):
+        return self._formatvalue(self.getvalue(row))
+
+    # a getvalue function can only be treated as pure if it is the
+    # source of the value; SumElements, for instance, aren't pure.
+
+    def _ispure(self):
+        return self.pure and self._getvalue is not None \
+            and type(self).getvalue == TextElement.getvalue
+
     # prior to 1.6.7, self.text was returned blindly;
     # Jose Jachuf changed the behavior to encode as
     # utf8.  this evidently broke other people's code,
@@ -176,36 +890,185 @@ class TextElement(BaseElement):
         if self._getvalue is not None:
             return self._getvalue(row)
         if self.key is not None:
-            return (TextElement.text_conversion(self.text) if self.text is not None else "") + (row[self.key] if row[self.key] is not None else "")
+            if self.text is None:
+                return row[self.key]
+            value = row[self.key]
+            return TextElement.text_conversion(self.text) \
+                + (value if value is not None else "")
         if self.text is not None:
             return TextElement.text_conversion(self.text)
         if self.sysvar is not None:
             return getattr(self.report, self.sysvar)
         return None
 
+    # isstatic() is true if the element prints the same thing every
+    # time, whatever the row; see Report.useforms.
+
+    def isstatic(self):
+        return self.key is None and self._getvalue is None \
+            and self.sysvar is None and self.onrender is None \
+            and not _overrides(self, TextElement,
+                ("generate", "gettext", "getvalue"))
+
     # generating an element returns a Renderer object
     # which can be used to print the element out.
 
     def generate(self, row):
         return TextRenderer(self.font, self.gettext(row), self.align,
-            self.font[1] + self.leading, self.width, pos=self.pos, parent=self)
+            self.font[1] + self.leading, self.width, pos=self.pos, parent=self,
+            onrender=self.onrender)
+
+    # signature() collects everything compile() depends on; when it
+    # changes, the compiled version is out of date.
+
+    def signature(self):
+        return (type(self), self.pos, self.font, self.text, self.key,
+            self._getvalue, self.sysvar, self._format, self.align,
+            self.width, self.leading, self.onrender, self.memoize, self.pure,
+            TextElement.text_conversion,
+            self.report.leftmargin, self.report._reportlab,
+            self.report._columns)
+
+    # compile() returns a function which does what generate() does,
+    # but with all the decisions (which value to print, how to
+    # look it up, how to align it) made in advance.  Subclasses which
+    # override generate(), gettext() or getvalue() get those methods
+    # back instead.
+
+    def compile(self):
+        if type(self).generate != TextElement.generate:
+            return self.generate
+        if type(self).gettext != TextElement.gettext:
+            gettext = self.gettext
+        else:
+            gettext = self._compilegettext()
+        font = self.font
+        width = self.width
+        plan = (font, self.align, font[1] + self.leading, width,
+            self.report.leftmargin) \
+            + _textdrawer(self.align, self.report._reportlab)
+
+        if self.memoize and type(self).gettext == TextElement.gettext:
+            return self._compilememo(plan)
+
+        report = self.report
+
+        def generate(row):
+            text = gettext(row)
+            if width is None:
+                lines = text.split("\n") if "\n" in text else (text,)
+            else:
+                lines = report._wrap(text, font, width)
+            return _CompiledTextRenderer(self, plan, lines)
+
+        return generate
+
+    # _compilememo() is compile() for an element which memoizes; the
+    # memo holds the wrapped lines, so a repeated value is neither
+    # formatted nor wrapped again.
+
+    def _compilememo(self, plan):
+        memo = self.memocache.memo(self,
+            self._memobasis() + (self.font, self.width, "lines"),
+            self.memoize)
+        get = memo.get
+        font = self.font
+        width = self.width
+        report = self.report
+
+        def wrap(text):
+            if width is None:
+                return text.split("\n") if "\n" in text else (text,)
+            return report._wrap(text, font, width)
+
+        if self._ispure():
+            gettext = self._compilegettext()
+            lines = lambda row: wrap(gettext(row))
+            return lambda row: _CompiledTextRenderer(self, plan,
+                get(_memokey(row), lines, row))
+        getvalue = self._compilegetvalue()
+        format = self._format
+
+        def lines(value):
+            return wrap("" if value is None else format(value))
+
+        def generate(row):
+            value = getvalue(row)
+            return _CompiledTextRenderer(self, plan,
+                get(_memokey(value), lines, value))
+
+        return generate
+
+    def _compilegettext(self):
+        getvalue = self._compilegetvalue()
+        format = self._format
+
+        def gettext(row):
+            value = getvalue(row)
+            if value is None:
+                return ""
+            return format(value)
+
+        return gettext
+
+    def _compilegetvalue(self):
+        if type(self).getvalue != TextElement.getvalue:
+            return self.getvalue
+        if self._getvalue is not None:
+            return self._getvalue
+        if self.key is not None:
+            columns = self.report._columns
+            if columns is not None and self.key in columns:
+                # rows are ColumnarRows; go straight to the column
+                column = columns.column(self.key)
+                lookup = lambda row: column[row.index]
+            else:
+                lookup = itemgetter(self.key)
+            if self.text is None:
+                return lookup
+            prefix = TextElement.text_conversion(self.text)
+
+            def getvalue(row):
+                value = lookup(row)
+                return prefix + (value if value is not None else "")
+
+            return getvalue
+        if self.text is not None:
+            text = TextElement.text_conversion(self.text)
+            return lambda row: text
+        if self.sysvar is not None:
+            report = self.report
+            sysvar = self.sysvar
+            return lambda row: getattr(report, sysvar)
+        return lambda row: None
+
+
+# Element is the name TextElement was known by originally,
+# and is still the name used in the documentation.
+
+Element = TextElement
 
 
 class SumElement(TextElement):
 
+    def isstatic(self):
+        return False
+
     def getvalue(self, row):
         rc = self.summary
         self.summary = 0
         return rc
 
     def summarize(self, row):
-        v = Element.getvalue(self, row)
+        v = TextElement.getvalue(self, row)
         if v is None:
             v = 0
         self.summary += v
 
 class ShapeRenderer(BaseRenderer):
-        
+
+    __slots__ = ("height", "width", "shape", "colors", "fill", "stroke")
+
     def __init__(self, height, width, shape, colors, fill, stroke, **kwargs):
         BaseRenderer.__init__(self, **kwargs)
         self.height = height
@@ -219,6 +1082,32 @@ class ShapeRenderer(BaseRenderer):
         BaseRenderer.render(self, offset, canvas)
         
         leftmargin = self.parent.report.leftmargin
+        batch = self.parent.report._batch
+        if batch is not None:
+            if self.colors is not None:
+                fillcolor = self.colors[(self.parent.report.rownumber-1) % len(self.colors)]
+            else:
+                fillcolor = canvas._fillColorObj
+            if self.shape == "rectangle":
+                state = (None, None, None)
+                if self.stroke:
+                    state = (canvas._lineWidth, canvas._strokeColorObj, None)
+                if self.fill:
+                    state = state[:2] + (fillcolor,)
+                batch.rect(canvas, state,
+                    self.pos[0]+leftmargin,
+                    (-1) * (self.pos[1]+offset+self.height),
+                    self.width,
+                    self.height,
+                    self.stroke, self.fill)
+            elif self.shape == "line":
+                state = (canvas._lineWidth, canvas._strokeColorObj, None)
+                batch.line(canvas, state,
+                    self.pos[0]+leftmargin,
+                    (-1) * (self.pos[1]+offset),
+                    self.pos[0]+leftmargin+self.width,
+                    (-1) * (self.pos[1]+offset+self.height))
+            return
         canvas.saveState()
         if self.colors is not None:
             canvas.setFillColor(self.colors[(self.parent.report.rownumber-1) % len(self.colors)])
@@ -249,7 +1138,12 @@ class ShapeElement(BaseElement):
         self.fill = fill
         self.stroke = stroke
         self.bottomMargin = bottomMargin
-        
+
+    def isstatic(self):
+        return self.onrender is None \
+            and (self.colors is None or len(self.colors) <= 1) \
+            and not _overrides(self, ShapeElement, ("generate",))
+
     def generate(self, row):
         return ShapeRenderer(pos=self.pos, height=self.height,
                  onrender=self.onrender, width=self.width, shape=self.shape,
@@ -269,11 +1163,21 @@ class Rule(object):
     def getvalue(self, row):
         return "-"
 
+    def isstatic(self):
+        return not _overrides(self, Rule, ("generate", "render"))
+
     def generate(self, row):
         return Rule(self.pos, self.width, self.height, self.report)
 
     def render(self, offset, canvas):
         leftmargin = self.report.leftmargin
+        if self.report._batch is not None:
+            self.report._batch.line(canvas, (self.height, black, None),
+                    self.pos[0]+leftmargin,
+                    -1 * (self.pos[1]+offset+self.height/2),
+                    self.pos[0]+self.width+leftmargin,
+                    -1 * (self.pos[1]+offset+self.height/2))
+            return
         canvas.saveState()
         canvas.setLineWidth(self.height)
         canvas.setStrokeGray(0)
@@ -288,8 +1192,118 @@ class Rule(object):
         return self
 
 
+# _imagedata() returns the image data given in place of a filename
+# (e.g. a BLOB straight from a database row), or None if the value
+# isn't image data.  Under Python 2, a str is only taken as data if
+# it starts like a JPEG, PNG, GIF or BMP file.
+
+_imagemagic = (b"\xff\xd8", b"\x89PNG", b"GIF8", b"BM")
+
+def _imagedata(image):
+    if isinstance(image, (bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, bytes) \
+    and (bytes is not str or image.startswith(_imagemagic)):
+        return image
+    return None
+
+
+# ImageCache resolves image filenames and image data to Reportlab
+# ImageReaders, reading and decoding each distinct image only once.
+# Images are identified by a hash of their content, so the same
+# picture reached by different paths (or loaded again from a database)
+# is only embedded once in the PDF.  Entries are discarded, least
+# recently used first, once their estimated size (encoded plus decoded)
+# exceeds maxbytes.  hits counts lookups answered from the cache, and
+# bytessaved the image data which did not have to be read, decoded
+# or embedded again as a result.  A filename is remembered along with
+# the file's modification time and size, so a file which is replaced
+# is read again.
+
+class ImageCache(object):
+
+    def __init__(self, maxbytes = 32 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytessaved = 0
+        self._images = OrderedDict()
+        self._paths = {}
+
+    def __len__(self):
+        return len(self._images)
+
+    # get() returns (name, reader), where name is unique to the image
+    # content, or None if image is neither a filename nor image data.
+
+    def get(self, image):
+        data = _imagedata(image)
+        if data is None:
+            if not isinstance(image, (str, _unicode)):
+                return None
+            stat = os.stat(image)
+            path = (image, stat.st_mtime, stat.st_size)
+            digest = self._paths.get(path)
+            if digest in self._images:
+                return self._hit(digest)
+            with open(image, "rb") as fp:
+                data = fp.read()
+            digest = hashlib.md5(data).hexdigest()
+            self._paths[path] = digest
+            if digest in self._images:
+                self._images[digest][2].append(path)
+                return self._hit(digest)
+            return self._miss(digest, data, [ path ])
+        digest = hashlib.md5(data).hexdigest()
+        if digest in self._images:
+            return self._hit(digest)
+        return self._miss(digest, data, [])
+
+    def _hit(self, digest):
+        entry = self._images.pop(digest)
+        self._images[digest] = entry
+        self.hits += 1
+        self.bytessaved += entry[1]
+        return "PollyImage" + digest, entry[0]
+
+    def _miss(self, digest, data, paths):
+        self.misses += 1
+        reader = ImageReader(io.BytesIO(data))
+        width, height = reader.getSize()
+        size = len(data) + 4 * width * height
+        while self._images and self.bytes + size > self.maxbytes:
+            self._discard()
+        if size <= self.maxbytes:
+            self._images[digest] = (reader, len(data), paths, size)
+            self.bytes += size
+        return "PollyImage" + digest, reader
+
+    def _discard(self):
+        digest, entry = self._images.popitem(last = False)
+        for path in entry[2]:
+            if self._paths.get(path) == digest:
+                del self._paths[path]
+        self.bytes -= entry[3]
+
+    def clear(self):
+        self._images.clear()
+        self._paths.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytessaved = 0
+
+
 class ImageRenderer(object):
 
+    __slots__ = ("parent", "pos", "width", "height", "text", "onrender")
+
+    # imagecache may be replaced with a larger (or smaller) ImageCache,
+    # or set to None to disable caching.
+
+    imagecache = ImageCache()
+
     def __init__(self, parent, pos, width, height, text, onrender):
         self.parent = parent
         self.pos = pos
@@ -302,12 +1316,44 @@ class ImageRenderer(object):
         if self.onrender is not None:
             self.onrender(self)
         leftmargin = self.parent.report.leftmargin
-        canvas.drawImage(self.text,
-                self.pos[0] + leftmargin,
-                -1 * (self.pos[1]+self.height+offset),
-                width = self.width,
-                height = self.height,
-                mask = "auto")
+        x = self.pos[0] + leftmargin
+        y = -1 * (self.pos[1]+self.height+offset)
+        image = None
+        if self.imagecache is not None and self.parent.report._reportlab:
+            image = self.imagecache.get(self.text)
+        batch = self.parent.report._batch
+        if image is None:
+            # anything drawn before this must stay beneath it
+            if batch is not None:
+                batch.before(canvas, (x, y, x + self.width, y + self.height))
+            source = self.text
+            if self.parent.report._reportlab:
+                # Reportlab takes only filenames and readers, not data
+                data = _imagedata(source)
+                if data is not None:
+                    source = ImageReader(io.BytesIO(data))
+            canvas.drawImage(source, x, y,
+                    width = self.width,
+                    height = self.height,
+                    mask = "auto")
+            return
+        # each distinct image is drawn once, as a unit square form, and
+        # then scaled into place wherever it is used.
+        name, reader = image
+        if not canvas.hasForm(name):
+            canvas.beginForm(name, 0, 0, 1, 1)
+            canvas.drawImage(reader, 0, 0, width = 1, height = 1,
+                    mask = "auto")
+            canvas.endForm()
+        if batch is not None:
+            batch.doform(canvas, name, (self.width, 0, 0, self.height, x, y),
+                (x, y, x + self.width, y + self.height))
+            return
+        canvas.saveState()
+        canvas.translate(x, y)
+        canvas.scale(self.width, self.height)
+        canvas.doForm(name)
+        canvas.restoreState()
 
     def applyoffset(self, offset):
         self.pos = (self.pos[0], self.pos[1] + offset)
@@ -341,11 +1387,94 @@ class Image(object):
             return self.text
         return ""
 
+    def isstatic(self):
+        return self.key is None and self._getvalue is None \
+            and self.onrender is None \
+            and not _overrides(self, Image, ("generate", "gettext", "getvalue"))
+
     def generate(self, row):
         return ImageRenderer(self, self.pos, self.width, self.height,
             self.gettext(row), self.onrender)
 
 
+# FormRenderer draws the static part of a Band (see Report.useforms).
+# The static elements are drawn once, into a form XObject, the first
+# time the Band is printed on a given canvas; after that, printing
+# them is just a matter of referencing the form.  The form is named
+# for what is drawn in it, so Bands which draw the same thing (the
+# same heading in each of several Reports generated onto one canvas,
+# for instance) share a single form.
+
+class FormRenderer(BaseRenderer):
+
+    __slots__ = ("renderers", "height", "name")
+
+    def __init__(self, parent, renderers, height, name = None):
+        BaseRenderer.__init__(self, parent = parent)
+        self.renderers = renderers
+        self.height = height
+        self.name = name
+
+    # formname() derives the name from everything the renderers will
+    # draw, that is, their attributes other than references back to
+    # the Band and Report, and from the page size and left margin.
+
+    def formname(self):
+        report = self.parent.report
+        content = [ report.pagesize, report.leftmargin ]
+        for renderer in self.renderers:
+            content.append(type(renderer).__name__)
+            for name in _attributes(renderer) or ():
+                if name not in ("parent", "report", "onrender"):
+                    content.append(getattr(renderer, name, None))
+        return "PollyForm" + hashlib.md5(repr(content).encode("utf-8")).hexdigest()
+
+    def render(self, offset, canvas):
+        if self.name is None:
+            self.name = self.formname()
+        name = self.name
+        if not canvas.hasForm(name):
+            # the form is drawn at offset 0 with the page's y axis, so
+            # its bounding box extends below (and around) the origin.
+            # text in the form must be drawn in the form, not batched.
+            report = self.parent.report
+            width, height = report.pagesize
+            batch, report._batch = report._batch, None
+            canvas.beginForm(name, -width, -height, 2 * width, height)
+            for renderer in self.renderers:
+                renderer.render(0, canvas)
+            canvas.endForm()
+            report._batch = batch
+        top = self.pos[1] + offset
+        if self.parent.report._batch is not None:
+            self.parent.report._batch.doform(canvas, name, (1, 0, 0, 1, 0, -top),
+                (0, -(top + self.height), self.parent.report.pagesize[0], -top))
+            return
+        canvas.saveState()
+        canvas.translate(0, -top)
+        canvas.doForm(name)
+        canvas.restoreState()
+
+
+# ChildRenderer renders the Renderers of a child band below its
+# parent; pos[1] holds the height of the parent, which is added to the
+# offset of each of them, so they need not be moved one by one.
+
+class ChildRenderer(BaseRenderer):
+
+    __slots__ = ("renderers", "height")
+
+    def __init__(self, parent, renderers, top, height):
+        BaseRenderer.__init__(self, parent = parent, pos = (0, top))
+        self.renderers = renderers
+        self.height = height
+
+    def render(self, offset, canvas):
+        offset += self.pos[1]
+        for renderer in self.renderers:
+            renderer.render(offset, canvas)
+
+
 class Band(object):
 
     # key, getvalue and previousvalue are used only for group headers and footers
@@ -365,6 +1494,12 @@ class Band(object):
         self.additionalbands = additionalbands or []
         self.backgrounds = backgrounds or []
 
+        self.report = None
+        self._static = None
+        self._ops = None
+        self._signature = None
+        self._column = None
+
     # generating a band creates a list of Renderer objects.
     # the first element of the list is a single integer
     # representing the calculated printing height of the
@@ -372,25 +1507,97 @@ class Band(object):
 
     def generate(self, row):
         elementlist = [ 0 ]
-        for element in self.elements:
-            renderer = element.generate(row)
+        if self.report is not None and self.report.useforms \
+        and self.report._reportlab:
+            generators, formrenderer = self.splitstatic(row)
+            if formrenderer is not None:
+                elementlist[0] = formrenderer.height
+                elementlist.append(FormRenderer(self,
+                    formrenderer.renderers, formrenderer.height,
+                    formrenderer.name))
+        elif self._ops is not None:
+            generators = self._ops
+        else:
+            generators = [ element.generate for element in self.elements ]
+        for generate in generators:
+            renderer = generate(row)
             elementlist[0] = max(elementlist[0], renderer.height + renderer.pos[1])
             elementlist.append(renderer)
         for band in self.childbands:
             childlist = band.generate(row)
-            for renderer in childlist[1:]:
-                renderer.applyoffset(elementlist[0])
-                elementlist.append(renderer)
-            elementlist[0] += childlist[0]
-        if len(self.backgrounds) > 0:
-            numBackgrounds = 1
+            height = childlist[0]
+            del childlist[0]
+            elementlist.append(ChildRenderer(self, childlist,
+                elementlist[0], height))
+            elementlist[0] += height
+        if self.backgrounds:
+            # render backgrounds first, in order
+            backgrounds = []
             for background in self.backgrounds:
                 background.height = elementlist[0]-background.pos[1]-background.bottomMargin
-                renderer = background.generate(row)
-                elementlist.insert(numBackgrounds,renderer) # render backgrounds first, in order
-                numBackgrounds += 1
+                backgrounds.append(background.generate(row))
+            elementlist[1:1] = backgrounds
         return elementlist
 
+    # compile() prepares the band for faster generation, replacing
+    # each Element's generate() method with the function returned by
+    # its compile() method (if it has one) in a flat list of ops.  The
+    # band must belong to a Report (see Report.compile()); if any of
+    # the elements change, compile() must be called again, which
+    # Report.beginreport() does for compiled reports.
+
+    def compile(self):
+        signature = [ (element, element.signature()
+                if hasattr(element, "signature") else None)
+            for element in self.elements ]
+        if signature != self._signature:
+            self._ops = [ element.compile()
+                    if hasattr(element, "compile") else element.generate
+                for element in self.elements ]
+            self._signature = signature
+            self._static = None
+        # a group band keyed on a column of a ColumnarSource reads it
+        # directly (see getvalue()).
+        columns = self.report._columns
+        self._column = None
+        if self.key is not None and columns is not None \
+        and self.key in columns:
+            self._column = columns.column(self.key)
+        for band in self.childbands:
+            band.compile()
+        for band in self.additionalbands:
+            band.compile()
+
+    # splitstatic() divides the elements of the band into those which
+    # print the same thing every time and those which don't, returning
+    # the generate functions of the latter, along with a FormRenderer
+    # for the former (or None if there aren't any).  The split, and
+    # the naming of the form, are done the first time the band is
+    # generated in each run of the report.
+
+    def splitstatic(self, row):
+        if self._static is None:
+            dynamic = []
+            renderers = []
+            height = 0
+            generators = self._ops
+            if generators is None:
+                generators = [ element.generate for element in self.elements ]
+            for element, generate in zip(self.elements, generators):
+                if getattr(element, "isstatic", None) is not None \
+                and element.isstatic():
+                    renderer = generate(row)
+                    height = max(height, renderer.height + renderer.pos[1])
+                    renderers.append(renderer)
+                else:
+                    dynamic.append(generate)
+            formrenderer = None
+            if renderers:
+                formrenderer = FormRenderer(self, renderers, height)
+                formrenderer.name = formrenderer.formname()
+            self._static = (dynamic, formrenderer)
+        return self._static
+
     # summarize() is only used for total bands, i.e. group and
     # report footers.
 
@@ -408,18 +1615,438 @@ class Band(object):
     def getvalue(self, row):
         if self._getvalue is not None:
             return self._getvalue(row)
+        if self._column is not None:
+            return self._column[row.index]
         if self.key is not None:
             return row[self.key]
         return 0
 
     def ischanged(self, row):
         pv = self.previousvalue
-        self.previousvalue = self.getvalue(row)
-        if pv is not None and pv != self.getvalue(row):
+        self.previousvalue = value = self.getvalue(row)
+        if pv is not None and pv != value:
             return 1
         return None
 
 
+# ColumnarSource is a datasource holding its data by column rather
+# than by row, as NumPy, pandas and Arrow do.  Iterating over it
+# yields a lightweight ColumnarRow for each index, which looks up
+# row[key] in the column, so no per-row dict or tuple is ever built.
+# Each column is converted to a list of plain Python values the first
+# time it is used (NumPy and pandas via tolist(), Arrow via
+# to_pylist()), and compiled Elements (see Report.compile()) read
+# their values straight from those lists.
+
+class ColumnarSource(object):
+
+    def __init__(self, columns, length = None):
+        self._columns = columns
+        self._lists = {}
+        if length is None:
+            length = 0
+            for column in columns.values():
+                length = len(column)
+                break
+        self._length = length
+
+    @classmethod
+    def fromnumpy(cls, array):
+        # structured arrays have named fields; a plain 2-d array is
+        # accessed by column number.
+        if array.dtype.names is not None:
+            columns = dict((name, array[name]) for name in array.dtype.names)
+        else:
+            columns = dict((i, array[:, i]) for i in range(array.shape[1]))
+        return cls(columns, len(array))
+
+    @classmethod
+    def fromdataframe(cls, frame):
+        return cls(dict((name, frame[name]) for name in frame.columns),
+            len(frame))
+
+    @classmethod
+    def fromarrow(cls, table):
+        return cls(dict((name, table.column(name))
+            for name in table.column_names), table.num_rows)
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, key):
+        return key in self._columns
+
+    def keys(self):
+        return list(self._columns.keys())
+
+    def column(self, key):
+        values = self._lists.get(key)
+        if values is None:
+            values = self._columns[key]
+            if hasattr(values, "tolist"):
+                values = values.tolist()
+            elif hasattr(values, "to_pylist"):
+                values = values.to_pylist()
+            else:
+                values = list(values)
+            self._lists[key] = values
+        return values
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield ColumnarRow(self, index)
+
+
+class ColumnarRow(object):
+
+    __slots__ = ("source", "index")
+
+    def __init__(self, source, index):
+        self.source = source
+        self.index = index
+
+    def __getitem__(self, key):
+        try:
+            return self.source._lists[key][self.index]
+        except KeyError:
+            return self.source.column(key)[self.index]
+
+    def get(self, key, default = None):
+        if key not in self.source:
+            return default
+        return self[key]
+
+    def keys(self):
+        return self.source.keys()
+
+    def __contains__(self, key):
+        return key in self.source
+
+    def __iter__(self):
+        return iter(self.source.keys())
+
+    def __len__(self):
+        return len(self.source._columns)
+
+
+# CursorSource is a datasource which runs a query on a DB-API
+# connection each time it is iterated, fetching the result a batch
+# at a time with fetchmany() so the first page can be generated
+# before the whole result has arrived, and only one batch is held in
+# memory at once.  Where the driver supports named (server-side)
+# cursors, as psycopg2 does, one is used, so the database server
+# holds the rest of the result rather than the client library; other
+# drivers get an ordinary cursor, as does a connection in autocommit
+# mode, where psycopg2 can't keep a named cursor open between
+# fetches.  A driver refusing the name, whether with a TypeError or
+# with one of its own DB-API errors (found, per PEP 249, as
+# connection.Error), is taken not to support it.  Each named cursor
+# gets a number after cursorname, so iterations running at once on
+# one connection (or several CursorSources sharing it) don't
+# collide.  Rows are returned as dicts keyed by column name, unless
+# the driver already returns mappings.
+#
+# rowsfetched, fetches and fetchtime (the seconds spent waiting for
+# the query and the batches) are kept up to date as the rows are
+# read, and restart from zero each time.
+
+_clock = getattr(time, "perf_counter", time.time)
+
+_cursornumbers = itertools.count(1)
+
+class CursorSource(object):
+
+    def __init__(self, connection, query, params = None,
+            batchsize = 1000, cursorname = "pollyreports"):
+        self.connection = connection
+        self.query = query
+        self.params = params
+        self.batchsize = batchsize
+        self.cursorname = cursorname
+        self.rowsfetched = 0
+        self.fetches = 0
+        self.fetchtime = 0.0
+
+    def cursor(self):
+        connection = self.connection
+        if self.cursorname is not None and \
+                getattr(connection, "autocommit", False) is not True:
+            name = "%s_%d" % (self.cursorname, next(_cursornumbers))
+            try:
+                return connection.cursor(name = name)
+            except (TypeError, getattr(connection, "Error", TypeError)):
+                pass
+        return connection.cursor()
+
+    def __iter__(self):
+        self.rowsfetched = 0
+        self.fetches = 0
+        self.fetchtime = 0.0
+        start = _clock()
+        cursor = self.cursor()
+        try:
+            if self.params is None:
+                cursor.execute(self.query)
+            else:
+                cursor.execute(self.query, self.params)
+            names = None
+            while 1:
+                rows = cursor.fetchmany(self.batchsize)
+                self.fetches += 1
+                self.fetchtime += _clock() - start
+                if not rows:
+                    break
+                self.rowsfetched += len(rows)
+                # named cursors may not describe the result until
+                # the first batch has been fetched
+                if names is None:
+                    names = [ column[0] for column in cursor.description ]
+                    mappings = hasattr(rows[0], "keys")
+                if mappings:
+                    for row in rows:
+                        yield row
+                else:
+                    for row in rows:
+                        yield dict(zip(names, row))
+                start = _clock()
+        finally:
+            cursor.close()
+
+
+# _GroupPlan works out, in advance and a column at a time, what the
+# group bands of a Report would otherwise discover row by row when
+# the datasource is a ColumnarSource:  at which rows each group
+# header and footer changes (exactly as Band.ischanged() would see
+# it, None included) and what each SumElement in the footers will
+# total at each of them.  The sums are added up in row order, from
+# 0, with None counting as 0, just as SumElement.summarize() does,
+# so even floating point totals come out the same.  Every entry is
+# keyed by row index, so a report restarted partway through (see
+# Report.setstate()) finds the same answers.
+#
+# Group bands keyed with getvalue functions (or replacing the Band
+# methods) can't be planned, and neither can SumElements which
+# aren't simply summing a column; if any Band has one, the plan
+# (or the sums part of it) is not used and the report falls back to
+# checking each row.
+
+class _GroupPlan(object):
+
+    def __init__(self, report, columns):
+        length = len(columns)
+        self.footers = {}
+        self.headers = {}
+        for i, band in enumerate(report.groupfooters):
+            for index in self.changes(band, columns):
+                self.footers[index] = i
+        for i in reversed(range(len(report.groupheaders))):
+            for index in self.changes(report.groupheaders[i], columns):
+                self.headers[index] = i
+
+        self.sums = None
+        self.totals = None
+        footers = [ self.summed(band, columns) for band in report.groupfooters ]
+        footer = []
+        if report.reportfooter:
+            footer = self.summed(report.reportfooter, columns)
+        if None in footers or footer is None:
+            return
+        breaks = sorted(self.footers)
+        self.sums = []
+        self.totals = []
+        for i, elements in enumerate(footers):
+            starts = [ index for index in breaks if self.footers[index] >= i ]
+            segments = [ {} for element in elements ]
+            totals = []
+            for element, segment in zip(elements, segments):
+                values = iter(self.values(element, columns))
+                start = 0
+                for index in starts:
+                    segment[index] = reduce(add,
+                        itertools.islice(values, index - start), 0)
+                    start = index
+                totals.append(reduce(add,
+                    itertools.islice(values, length - start), 0))
+            self.sums.append((elements, segments))
+            self.totals.append((elements, totals))
+        self.totals.append((footer, [ reduce(add, self.values(element, columns), 0)
+            for element in footer ]))
+
+    # changes() returns the indexes of the rows at which the band's
+    # ischanged() would be true.
+
+    @staticmethod
+    def changes(band, columns):
+        column = columns.column(band.key)
+        return [ index
+            for index, (previous, value)
+                in enumerate(zip(column, itertools.islice(column, 1, None)), 1)
+                    if previous is not None and previous != value ]
+
+    # summed() returns the SumElements which band.summarize() would
+    # add to, or None if any of them (or anything else with a summarize
+    # method) can't be summed by column.
+
+    @staticmethod
+    def summed(band, columns):
+        result = []
+        pending = [ band ]
+        while pending:
+            band = pending.pop(0)
+            if type(band).summarize != Band.summarize:
+                return None
+            for element in band.elements:
+                if not hasattr(element, "summarize"):
+                    continue
+                if not isinstance(element, SumElement) \
+                or type(element).summarize != SumElement.summarize \
+                or element._getvalue is not None or element.text is not None \
+                or element.key is None or element.key not in columns:
+                    return None
+                result.append(element)
+            pending.extend(band.childbands)
+            pending.extend(band.additionalbands)
+        return result
+
+    @staticmethod
+    def values(element, columns):
+        column = columns.column(element.key)
+        if None in column:
+            return [ 0 if value is None else value for value in column ]
+        return column
+
+    # plannable() is true if all the group bands are keyed on
+    # columns of the datasource.
+
+    @staticmethod
+    def plannable(report, columns):
+        for band in report.groupheaders + report.groupfooters:
+            if band._getvalue is not None or band.key is None \
+            or band.key not in columns \
+            or type(band).ischanged != Band.ischanged \
+            or type(band).getvalue != Band.getvalue:
+                return False
+        return True
+
+    # settotals() loads the SumElements of the group footers which
+    # are about to be printed at the given row (or, with no row, at
+    # the end of the report) with their totals.
+
+    def settotals(self, last, index = None):
+        if index is None:
+            for elements, totals in self.totals:
+                for element, total in zip(elements, totals):
+                    element.summary = total
+            return
+        for elements, segments in self.sums[:last+1]:
+            for element, segment in zip(elements, segments):
+                element.summary = segment[index]
+
+
+# ReportStats collects timings and call counts for a Report while it
+# is generated, if it is assigned to Report.stats beforehand.  Each
+# timing is kept under its "stack", a tuple naming the calls it was
+# made within, outermost first; for instance, a format function
+# called while the detail band is generated is timed under
+# ("detailband.generate", "detailband.elements[1].format").  The
+# Report times its Bands by putting timing wrappers in place of
+# their generate() methods, and of the getvalue, format and onrender
+# functions of their Elements, only for as long as it is being
+# generated, so a Report without stats runs exactly as before.
+
+class ReportStats(object):
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.timings = {}
+        self.pagebreaks = 0
+        self.stack = []
+
+    def add(self, stack, seconds):
+        entry = self.timings.get(stack)
+        if entry is None:
+            self.timings[stack] = [ 1, seconds ]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    # timed() returns a function which calls function, timing it
+    # under the current stack plus name.
+
+    def timed(self, name, function):
+        stack = self.stack
+        add = self.add
+
+        def timer(*args, **kwargs):
+            stack.append(name)
+            start = _clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add(tuple(stack), _clock() - start)
+                stack.pop()
+
+        return timer
+
+    # totals() gives the calls and total seconds for each name, over
+    # all the stacks it appears at the end of.
+
+    def totals(self):
+        totals = {}
+        for stack, (calls, seconds) in self.timings.items():
+            entry = totals.setdefault(stack[-1], [ 0, 0.0 ])
+            entry[0] += calls
+            entry[1] += seconds
+        return totals
+
+    def tojson(self):
+        return json.dumps({
+            "pagebreaks": self.pagebreaks,
+            "timings": [ { "stack": list(stack), "calls": calls,
+                    "seconds": seconds }
+                for stack, (calls, seconds) in sorted(self.timings.items()) ],
+        }, indent = 2)
+
+    # collapsed() gives the timings in the "collapsed stack" format
+    # used by flame graph tools:  one line per stack, the names
+    # joined by semicolons, followed by the time (in microseconds)
+    # spent in the last of them, not counting the calls within it.
+
+    def collapsed(self):
+        inner = {}
+        for stack, (calls, seconds) in self.timings.items():
+            if len(stack) > 1:
+                inner[stack[:-1]] = inner.get(stack[:-1], 0.0) + seconds
+        lines = []
+        for stack, (calls, seconds) in sorted(self.timings.items()):
+            own = max(0.0, seconds - inner.get(stack, 0.0))
+            lines.append("%s %d" % (";".join(("report",) + stack),
+                int(own * 1000000 + 0.5)))
+        return "\n".join(lines) + "\n"
+
+
+# _StatsRenderer renders the Renderers generated by a Band (taking
+# their place in the list the Band returns), timing them together.
+
+class _StatsRenderer(BaseRenderer):
+
+    __slots__ = ("renderers", "timer")
+
+    def __init__(self, stats, name, renderers):
+        BaseRenderer.__init__(self, pos = (0, 0))
+        self.renderers = renderers
+        self.timer = stats.timed(name, self.renderall)
+
+    def render(self, offset, canvas):
+        self.timer(offset, canvas)
+
+    def renderall(self, offset, canvas):
+        for renderer in self.renderers:
+            renderer.render(offset, canvas)
+
+
 class Report(object):
 
     def __init__(self, datasource = None,
@@ -448,15 +2075,79 @@ class Report(object):
 
         self.rowfunc = None
 
+        # draw the static parts of bands as reusable forms
+        self.useforms = 0
+
+        # draw the text on each page in one go, grouped by font
+        self.batching = 0
+
         # private
         self._sum_detail_ht = 0
         self._avg_detail_ht = 0
         self._max_detail_ht = 0
+        self._prevrow = None
+        self._firstrow = 1
+        self._lastrow = None
+        self._complete = 0
+        self._bands = []
+        self._summed = []
+        self._reportlab = False
+        self._compiled = 0
+        self._batch = None
+        self._columns = None
+        self._groupplan = None
+        self.pipelinestats = None
+        self.burststats = None
+        self.documents = None
+        self.incrementalstats = None
+        self.truncated = 0
+
+        # page counts, set by measure()
+        self.pagecount = None
+        self.grouppagenumbers = []
+        self.grouppagecounts = []
+        self._measuring = 0
+        self._measured = 0
+        self._wrapcache = None
+        self._wrap = _wrap
+        self._groupspans = None
+        self._groupstarts = []
+        self._groupsseen = []
+
+        # the unfinished pages, while iterpages() is running
+        self._pages = None
+
+        # timings (see ReportStats)
+        self.stats = None
+        self._instrumented = []
+
+        # used by the layout pass of generateparallel()
+        self._checkpoints = None
+        self._rowindex = 0
+        self._rowstate = None
 
     def newpage(self, canvas, row):
+        if self._pages is not None:
+            if self.pagenumber:
+                self._pages[-1].lastrow = self.rownumber
+            self._pages.append(Page(self.pagenumber + 1,
+                [ band.getvalue(row) if row is not None else None
+                    for band in self.groupheaders ],
+                self.rownumber))
         if self.pagenumber:
+            if self._batch is not None:
+                self._batch.flush(canvas)
             canvas.showPage()
         self.pagenumber += 1
+        if self.stats is not None:
+            self.stats.pagebreaks += 1
+        for i, start in enumerate(self._groupstarts):
+            if start == 0:
+                self._groupstarts[i] = self.pagenumber
+            elif start:
+                self.grouppagenumbers[i] = self.pagenumber - start + 1
+        if self._checkpoints is not None:
+            self._checkpoints.append((self._rowindex, self._rowstate))
         self.endofpage = self.pagesize[1] - self.bottommargin
         canvas.translate(0, self.pagesize[1])
         self.current_offset = self.topmargin
@@ -472,17 +2163,27 @@ class Report(object):
         if self.pagefooter:
             elementlist = self.pagefooter.generate(row)
             self.endofpage = self.pagesize[1] - self.bottommargin - elementlist[0]
-            for el in elementlist[1:]:
-                el.render(self.endofpage, canvas)
+            if not self._measuring:
+                for el in elementlist[1:]:
+                    el.render(self.endofpage, canvas)
 
     def addtopage(self, canvas, elementlist):
-        for el in elementlist[1:]:
-            el.render(self.current_offset, canvas)
+        if not self._measuring:
+            for el in elementlist[1:]:
+                el.render(self.current_offset, canvas)
         return elementlist[0]
 
     def setreference(self, bands):
         for band in bands:
             if band is not None:
+                # a band's compiled ops belong to the report they were
+                # compiled for (its margins, its sysvars), so a band
+                # moving to another report drops them
+                if band.report is not self:
+                    band._ops = None
+                    band._signature = None
+                band.report = self
+                band._static = None
                 for element in band.elements:
                     element.report = self
                 self.setreference(band.childbands)
@@ -490,7 +2191,211 @@ class Report(object):
                 for background in band.backgrounds:
                     background.report = self
 
+    # compile() compiles every Band in the report (see Band.compile()).
+    # A compiled report checks its Bands each time it is generated,
+    # compiling them again if they have changed since.
+
+    def compile(self):
+        self._compiled = 1
+        self.setreference([
+            self.titleband, self.detailband,
+            self.pageheader, self.pagefooter,
+            self.reportheader, self.reportfooter,
+        ])
+        self.setreference(self.groupheaders)
+        self.setreference(self.groupfooters)
+        for band in self.allbands():
+            band.compile()
+
+    # _uncompile() puts a compiled report back the way it was before
+    # compile() was called.
+
+    def _uncompile(self):
+        self._compiled = 0
+        for band in self.allbands():
+            band._ops = None
+            band._signature = None
+            band._static = None
+            band._column = None
+
+    # allbands() returns every Band in the report, including
+    # child and additional bands, always in the same order.
+
+    def allbands(self):
+        result = []
+        pending = [
+            self.titleband, self.detailband,
+            self.pageheader, self.pagefooter,
+            self.reportheader, self.reportfooter,
+        ] + self.groupheaders + self.groupfooters
+        while pending:
+            band = pending.pop(0)
+            if band is not None:
+                result.append(band)
+                pending.extend(band.childbands)
+                pending.extend(band.additionalbands)
+        return result
+
+    # getstate() and setstate() capture and restore everything
+    # which carries over from one row to the next:  counters,
+    # the vertical position on the page, the previous values of
+    # the group bands and the running totals of SumElements.
+    # They are only valid after beginreport() has been called.
+
+    def getstate(self):
+        self._syncgroups()
+        return (
+            self.pagenumber, self.rownumber,
+            self.current_offset, self.endofpage,
+            self._sum_detail_ht, self._avg_detail_ht, self._max_detail_ht,
+            self._prevrow, self._firstrow, self._lastrow,
+            [ band.previousvalue for band in self._bands ],
+            [ element.summary for element in self._summed ],
+            list(self._groupstarts), list(self._groupsseen),
+            list(self.grouppagenumbers), list(self.grouppagecounts),
+        )
+
+    # with a _GroupPlan, the group bands' previous values aren't
+    # kept up to date row by row; _syncgroups() catches them up.
+
+    def _syncgroups(self):
+        if self._groupplan is None or self._prevrow is None:
+            return
+        for band in self.groupheaders + self.groupfooters:
+            band.previousvalue = band.getvalue(self._prevrow)
+
+    def setstate(self, state):
+        (self.pagenumber, self.rownumber,
+         self.current_offset, self.endofpage,
+         self._sum_detail_ht, self._avg_detail_ht, self._max_detail_ht,
+         self._prevrow, self._firstrow, self._lastrow,
+         previousvalues, summaries,
+         groupstarts, groupsseen, pagenumbers, pagecounts) = state
+        self._groupstarts = list(groupstarts)
+        self._groupsseen = list(groupsseen)
+        self.grouppagenumbers = list(pagenumbers)
+        self.grouppagecounts = list(pagecounts)
+        for band, previousvalue in zip(self._bands, previousvalues):
+            band.previousvalue = previousvalue
+        for element, summary in zip(self._summed, summaries):
+            element.summary = summary
+
+    # generate() is broken into three steps, beginreport(),
+    # processrow() (called once per row of the datasource) and
+    # endreport(), so that a report can be driven one row at a
+    # time, or restarted in the middle via setstate().
+
     def generate(self, canvas):
+        try:
+            self.beginreport(canvas)
+            rows = self.datasource
+            if self.stats is not None:
+                rows = self._timedrows(rows)
+            for row in rows:
+                self.processrow(canvas, row)
+            self.endreport(canvas)
+        finally:
+            self._uninstrument()
+
+    # _timedrows() passes on the rows, timing the wait for each
+    # under ("datasource",).
+
+    def _timedrows(self, rows):
+        rows = iter(rows)
+        add = self.stats.add
+        while 1:
+            start = _clock()
+            try:
+                row = next(rows)
+            except StopIteration:
+                add(("datasource",), _clock() - start)
+                return
+            add(("datasource",), _clock() - start)
+            yield row
+
+    # _instrument() puts the timing wrappers described under
+    # ReportStats in place, if stats is set, naming each Band after
+    # the attribute it is found in (e.g. "groupfooters[1]", or
+    # "detailband.childbands[0]"); _uninstrument() takes them away
+    # again, and is called by endreport(), by the next call to
+    # beginreport() if the report didn't finish, and by each of the
+    # generate methods on the way out, however they end.
+    #
+    # It also sets up _wrap, which wraps text for this Report's
+    # TextElements during the run:  through TextRenderer.wrapcache,
+    # or the WrapCache filled in by measure() (for the measuring run
+    # and the one after it), timed if stats is set.  Nothing outside
+    # the Report is changed, so reports running at the same time
+    # don't disturb each other.
+
+    def _instrument(self):
+        self._uninstrument()
+        wrapcache = TextRenderer.wrapcache
+        if self._wrapcache is not None:
+            wrapcache = self._wrapcache
+            if not self._measuring:
+                self._wrapcache = None
+        if wrapcache is not None:
+            self._wrap = wrapcache.split
+        stats = self.stats
+        if stats is None:
+            return
+        stats.stack = []
+        self._wrap = stats.timed("wrap", self._wrap)
+        bands = [ (name, getattr(self, name)) for name in (
+            "titleband", "detailband", "pageheader", "pagefooter",
+            "reportheader", "reportfooter") ]
+        bands.extend(("groupheaders[%d]" % i, band)
+            for i, band in enumerate(self.groupheaders))
+        bands.extend(("groupfooters[%d]" % i, band)
+            for i, band in enumerate(self.groupfooters))
+        while bands:
+            name, band = bands.pop(0)
+            if band is None:
+                continue
+            self._instrumentband(stats, name, band)
+            bands.extend(("%s.childbands[%d]" % (name, i), child)
+                for i, child in enumerate(band.childbands))
+            bands.extend(("%s.additionalbands[%d]" % (name, i), child)
+                for i, child in enumerate(band.additionalbands))
+
+    def _instrumentband(self, stats, name, band):
+        timer = stats.timed(name + ".generate", band.generate)
+
+        def generate(row):
+            elementlist = timer(row)
+            return [ elementlist[0],
+                _StatsRenderer(stats, name + ".render", elementlist[1:]) ]
+
+        self._instrumented.append((band, "generate", None))
+        band.generate = generate
+        for kind, elements in (("elements", band.elements),
+                ("backgrounds", band.backgrounds)):
+            for i, element in enumerate(elements):
+                prefix = "%s.%s[%d]." % (name, kind, i)
+                for attribute, label in (("_getvalue", "getvalue"),
+                        ("_format", "format"), ("onrender", "onrender")):
+                    function = getattr(element, attribute, None)
+                    if function is not None:
+                        self._instrumented.append((element, attribute, function))
+                        setattr(element, attribute,
+                            stats.timed(prefix + label, function))
+
+    def _uninstrument(self):
+        self._wrap = _wrap
+        # the page counts found by measure() are used up by the first
+        # run to finish after it (not counting layout passes)
+        if self._complete and self._checkpoints is None \
+                and not self._measuring:
+            self._measured = 0
+        while self._instrumented:
+            target, attribute, value = self._instrumented.pop()
+            if value is None:
+                delattr(target, attribute)
+            else:
+                setattr(target, attribute, value)
+
+    def beginreport(self, canvas):
 
         # every Element in every Band needs a reference to this Report
         self.setreference([
@@ -502,99 +2407,206 @@ class Report(object):
         self.setreference(self.groupfooters)
 
         self.pagesize = (int(canvas._pagesize[0]), int(canvas._pagesize[1]))
+        # some things (our own text drawing, forms) are only done on
+        # real Reportlab canvases (or wrappers around them), falling
+        # back to the plain canvas methods on anything else.
+        self._reportlab = isinstance(canvas, Canvas) \
+            or getattr(canvas, "_reportlab", False)
+        self._batch = None
+        if self.batching and self._reportlab:
+            self._batch = PageBatch()
+        # compiled Elements can read a ColumnarSource's columns directly,
+        # unless a rowfunc stands between them and the rows.
+        self._columns = None
+        if isinstance(self.datasource, ColumnarSource) and self.rowfunc is None:
+            self._columns = self.datasource
         self.current_offset = self.pagesize[1]
         self.pagenumber = 0
         self.endofpage = self.pagesize[1] - self.bottommargin
-        prevrow = None
-        firstrow = 1
+        self._prevrow = None
+        self._firstrow = 1
+        self._lastrow = None
+        self._complete = 0
+        levels = len(self.groupheaders)
+        self._groupstarts = [ None ] * levels
+        self._groupsseen = [ 0 ] * levels
+        self.grouppagenumbers = [ None ] * levels
+        self.grouppagecounts = [ None ] * levels
+        # while measuring, the page counts are 0, so that they can be
+        # printed (or calculated with) before they are known; a run
+        # not measured for doesn't keep those of an earlier run.
+        if self._measuring:
+            self.pagecount = 0
+        elif not self._measured:
+            self.pagecount = None
+            self._groupspans = None
+        if self._groupspans is not None and len(self._groupspans) != levels:
+            self._groupspans = None
+
+        self._instrument()
+        self._bands = self.allbands()
+        self._summed = [ element
+            for band in self._bands
+                for element in band.elements
+                    if hasattr(element, "summary") ]
+
+        # every run starts afresh, even if the Report has been
+        # generated before (or stopped partway through)
+        self.rownumber = 0
+        self._sum_detail_ht = 0
+        self._avg_detail_ht = 0
+        self._max_detail_ht = 0
+        for band in self._bands:
+            band.previousvalue = None
+        for element in self._summed:
+            element.summary = 0
+        if self._compiled:
+            for band in self._bands:
+                band.compile()
+        self._groupplan = None
+        if self._columns is not None \
+        and _GroupPlan.plannable(self, self._columns):
+            self._groupplan = _GroupPlan(self, self._columns)
 
-        for row in self.datasource:
+    def processrow(self, canvas, row):
 
-            if self.rowfunc is not None:
-                row = self.rowfunc(row)
+        if self.rowfunc is not None:
+            row = self.rowfunc(row)
 
-            if row is None:
-                continue
+        self._lastrow = row
+
+        if row is None:
+            return
 
-            self.rownumber += 1
+        prevrow = self._prevrow
 
-            if firstrow:
-                firstrow = None
-                for band in self.groupheaders:
-                    elementlist = band.generate(row)
+        self.rownumber += 1
+
+        if self._firstrow:
+            self._firstrow = None
+            for i, band in enumerate(self.groupheaders):
+                self._startgroup(i)
+                elementlist = band.generate(row)
+                if (self.current_offset + elementlist[0]) >= self.endofpage:
+                    self.newpage(canvas, row)
+                self.current_offset += self.addtopage(canvas, elementlist)
+                self._groupstarts[i] = self._groupstarts[i] or self.pagenumber
+                for aband in band.additionalbands:
+                    elementlist = aband.generate(row)
                     if (self.current_offset + elementlist[0]) >= self.endofpage:
                         self.newpage(canvas, row)
                     self.current_offset += self.addtopage(canvas, elementlist)
-                    for aband in band.additionalbands:
-                        elementlist = aband.generate(row)
-                        if (self.current_offset + elementlist[0]) >= self.endofpage:
-                            self.newpage(canvas, row)
-                        self.current_offset += self.addtopage(canvas, elementlist)
 
+        plan = self._groupplan
+        if plan is not None:
+            lastchanged = plan.footers.get(row.index)
+            if lastchanged is not None and plan.sums is not None:
+                plan.settotals(lastchanged, row.index)
+        else:
             lastchanged = None
             for i in range(len(self.groupfooters)):
                 if self.groupfooters[i].ischanged(row):
                     lastchanged = i
-            if lastchanged is not None:
-                for i in range(lastchanged+1):
-                    elementlist = self.groupfooters[i].generate(prevrow)
-                    if self.groupfooters[i].newpagebefore \
-                    or (self.current_offset + elementlist[0]) >= self.endofpage:
-                        self.newpage(canvas, prevrow)
+        if lastchanged is not None:
+            for i in range(lastchanged+1):
+                elementlist = self.groupfooters[i].generate(prevrow)
+                if self.groupfooters[i].newpagebefore \
+                or (self.current_offset + elementlist[0]) >= self.endofpage:
+                    self.newpage(canvas, prevrow)
+                self.current_offset += self.addtopage(canvas, elementlist)
+                for aband in self.groupfooters[i].additionalbands:
+                    elementlist = aband.generate(row)
+                    if (self.current_offset + elementlist[0]) >= self.endofpage:
+                        self.newpage(canvas, row)
                     self.current_offset += self.addtopage(canvas, elementlist)
-                    for aband in self.groupfooters[i].additionalbands:
-                        elementlist = aband.generate(row)
-                        if (self.current_offset + elementlist[0]) >= self.endofpage:
-                            self.newpage(canvas, row)
-                        self.current_offset += self.addtopage(canvas, elementlist)
-                    if self.groupfooters[i].newpageafter:
-                        self.current_offset = self.pagesize[1]
+                if self.groupfooters[i].newpageafter:
+                    self.current_offset = self.pagesize[1]
+        if plan is None or plan.sums is None:
             for band in self.groupfooters:
                 band.summarize(row)
 
+        if plan is not None:
+            firstchanged = plan.headers.get(row.index)
+        else:
             firstchanged = None
             for i in range(len(self.groupheaders)):
                 if self.groupheaders[i].ischanged(row):
                     if firstchanged is None:
                         firstchanged = i
-            if firstchanged is not None:
-                for i in range(firstchanged, len(self.groupheaders)):
-                    elementlist = self.groupheaders[i].generate(row)
-                    if self.groupheaders[i].newpagebefore \
-                    or (self.current_offset + elementlist[0] + self._avg_detail_ht) >= self.endofpage:
-                        self.newpage(canvas, row)
-                    self.current_offset += self.addtopage(canvas, elementlist)
-                    for aband in self.groupheaders[i].additionalbands:
-                        elementlist = aband.generate(row)
-                        if (self.current_offset + elementlist[0]) >= self.endofpage:
-                            self.newpage(canvas, row)
-                        self.current_offset += self.addtopage(canvas, elementlist)
-                    if self.groupheaders[i].newpageafter:
-                        self.current_offset = self.pagesize[1]
-
-            if self.detailband is not None:
-                elementlist = self.detailband.generate(row)
-                self._max_detail_ht = max(elementlist[0], self._max_detail_ht)
-                self._sum_detail_ht += elementlist[0]
-                self._avg_detail_ht = \
-                    ((self._sum_detail_ht // self.rownumber) + self._max_detail_ht) // 2
-                if (self.current_offset + elementlist[0]) >= self.endofpage:
+        if firstchanged is not None:
+            for i in range(firstchanged, len(self.groupheaders)):
+                self._startgroup(i)
+                elementlist = self.groupheaders[i].generate(row)
+                if self.groupheaders[i].newpagebefore \
+                or (self.current_offset + elementlist[0] + self._avg_detail_ht) >= self.endofpage:
                     self.newpage(canvas, row)
                 self.current_offset += self.addtopage(canvas, elementlist)
-                for aband in self.detailband.additionalbands:
+                self._groupstarts[i] = self._groupstarts[i] or self.pagenumber
+                for aband in self.groupheaders[i].additionalbands:
                     elementlist = aband.generate(row)
                     if (self.current_offset + elementlist[0]) >= self.endofpage:
                         self.newpage(canvas, row)
                     self.current_offset += self.addtopage(canvas, elementlist)
+                if self.groupheaders[i].newpageafter:
+                    self.current_offset = self.pagesize[1]
 
-            if self.reportfooter:
-                self.reportfooter.summarize(row)
-
-            prevrow = row
+        if self.detailband is not None:
+            elementlist = self.detailband.generate(row)
+            self._max_detail_ht = max(elementlist[0], self._max_detail_ht)
+            self._sum_detail_ht += elementlist[0]
+            self._avg_detail_ht = \
+                ((self._sum_detail_ht // self.rownumber) + self._max_detail_ht) // 2
+            if (self.current_offset + elementlist[0]) >= self.endofpage:
+                self.newpage(canvas, row)
+            self.current_offset += self.addtopage(canvas, elementlist)
+            for aband in self.detailband.additionalbands:
+                elementlist = aband.generate(row)
+                if (self.current_offset + elementlist[0]) >= self.endofpage:
+                    self.newpage(canvas, row)
+                self.current_offset += self.addtopage(canvas, elementlist)
 
-        if prevrow:
+        if self.reportfooter and (plan is None or plan.sums is None):
+            self.reportfooter.summarize(row)
+
+        self._prevrow = row
+
+    # _startgroup() is called as each group header is about to be
+    # generated, ending the group before it at this level.  Each
+    # entry of _groupstarts is None until the level's first group
+    # starts, 0 while its header waits to be placed, and then the
+    # number of the page the group starts on.
+
+    def _startgroup(self, i):
+        if self._groupstarts[i]:
+            self._endgroup(i)
+        self._groupstarts[i] = 0
+        self.grouppagenumbers[i] = 1
+        if self._measuring:
+            self.grouppagecounts[i] = 0
+        elif self._groupspans is not None:
+            spans = self._groupspans[i]
+            seen = self._groupsseen[i]
+            self.grouppagecounts[i] = spans[seen] if seen < len(spans) else None
+        self._groupsseen[i] += 1
+
+    def _endgroup(self, i):
+        if self._measuring:
+            self._groupspans[i].append(
+                self.pagenumber - self._groupstarts[i] + 1)
+
+    def endreport(self, canvas):
+
+        row = self._lastrow
+
+        plan = self._groupplan
+        if plan is not None:
+            self._syncgroups()
+            if plan.sums is not None:
+                plan.settotals(None)
+
+        if self._prevrow:
             for band in self.groupfooters:
-                elementlist = band.generate(prevrow)
+                elementlist = band.generate(self._prevrow)
                 if band.newpagebefore or (self.current_offset + elementlist[0]) >= self.endofpage:
                     self.newpage(canvas, row)
                 self.current_offset += self.addtopage(canvas, elementlist)
@@ -606,6 +2618,10 @@ class Report(object):
                 if band.newpageafter:
                     self.current_offset = self.pagesize[1]
 
+            for i, start in enumerate(self._groupstarts):
+                if start:
+                    self._endgroup(i)
+
             if self.reportfooter:
                 elementlist = self.reportfooter.generate(row)
                 if self.reportfooter.newpagebefore or (self.current_offset + elementlist[0]) >= self.endofpage:
@@ -617,7 +2633,1224 @@ class Report(object):
                         self.newpage(canvas, row)
                     self.current_offset += self.addtopage(canvas, elementlist)
 
+        if self._batch is not None:
+            self._batch.flush(canvas)
+        if self._pages:
+            self._pages[-1].lastrow = self.rownumber
+        # everything has been drawn; only the last page is left to end
+        self._complete = 1
+        canvas.showPage()
+        self._uninstrument()
+
+    # measure() runs the report without drawing anything, to count
+    # its pages, so that "Page X of Y" can be printed by the next run
+    # via sysvar = "pagecount" (see the documentation).  It also
+    # counts the pages of each group, and keeps every text it wraps
+    # for the next run, which doesn't have to wrap them again.  The
+    # counts are 0 while measuring, and are kept only until the next
+    # run finishes; the run after that has None again, unless the
+    # report is measured again.
+
+    def measure(self, pagesize = None):
+        self._measured = 0
+        self._wrapcache = WrapCache(None)
+        self._groupspans = [ [] for band in self.groupheaders ]
+        self._measuring = 1
+        try:
+            self.generate(_NullCanvas(pagesize or defaultPageSize))
+        finally:
+            self._measuring = 0
+        self.pagecount = self.pagenumber
+        self._measured = 1
+        return self.pagecount
+
+    # grouppagenumber and grouppagecount are the page number within
+    # the current outermost group, and that group's page count, for
+    # use as sysvars; grouppagenumbers and grouppagecounts hold the
+    # same for every level of group.
+
+    @property
+    def grouppagenumber(self):
+        return self.grouppagenumbers[0] if self.grouppagenumbers else None
+
+    @property
+    def grouppagecount(self):
+        return self.grouppagecounts[0] if self.grouppagecounts else None
+
+    # paginate() runs the report without drawing anything, returning
+    # the page plan:  a list of pages, each of which is a list of
+    # the drawing operations (see RecordingCanvas, below) needed to
+    # produce it.  Text, font and alignment are fully resolved, so
+    # the plan can be inspected, pickled, or passed to replay().
+
+    def paginate(self, pagesize = None):
+        canvas = RecordingCanvas(pagesize)
+        self.generate(canvas)
+        return canvas.pages
+
+    # iterpages() generates the report a page at a time, yielding a
+    # Page (see below) as soon as each is finished; nothing is read
+    # from the datasource until the next page is asked for.  If the
+    # caller stops early (closing the generator), the datasource's
+    # iterator is closed, and the report is left as it was after the
+    # last row processed, as with agenerate().
+
+    def iterpages(self, pagesize = None):
+        canvas = RecordingCanvas(pagesize)
+        source = iter(self.datasource)
+        rows = source
+        if self.stats is not None:
+            rows = self._timedrows(rows)
+        self._pages = []
+        try:
+            self.beginreport(canvas)
+            for row in rows:
+                self.processrow(canvas, row)
+                if canvas.pages:
+                    for page in self._finishedpages(canvas):
+                        yield page
+            self.endreport(canvas)
+            for page in self._finishedpages(canvas):
+                yield page
+        finally:
+            self._pages = None
+            self._uninstrument()
+            if hasattr(source, "close"):
+                source.close()
+
+    # generatepreview() generates just the first few pages of the
+    # report onto the canvas, reading no more of the datasource than
+    # it needs to, and closing its iterator (so that a CursorSource,
+    # say, gives up its query) when done.  Normally the pages are
+    # exactly the first pages of the full report.  With footers, the
+    # report is instead brought to an end (marker, then the group and
+    # report footers, with the totals so far) after the last row which
+    # fits in those pages, found by a layout pass over the rows read;
+    # the footers may spill onto another page.  Either way, truncated
+    # is set if the report was cut short, and may be used as a sysvar.
+
+    def generatepreview(self, canvas, pages = 1, footers = 0, marker = None):
+        source = iter(self.datasource)
+        self.truncated = 0
+        try:
+            if footers:
+                self._previewfooters(canvas, source, pages, marker)
+            else:
+                self._previewpages(canvas, source, pages)
+        finally:
+            self._uninstrument()
+            if hasattr(source, "close"):
+                source.close()
+
+    def _previewpages(self, canvas, source, pages):
+        pagerange = _PageRange(canvas, self, 1, pages)
+        try:
+            self.beginreport(pagerange)
+            for row in source:
+                self.processrow(pagerange, row)
+            self.endreport(pagerange)
+        except _EndOfRange:
+            # the range may end just as the report does
+            self.truncated = 0 if self._complete else 1
+            canvas.showPage()
+
+    def _previewfooters(self, canvas, source, pages, marker):
+        rows = []
+        self._checkpoints = []
+        try:
+            layout = _NullCanvas(canvas._pagesize)
+            self.beginreport(layout)
+            for row in source:
+                self._rowindex = len(rows)
+                rows.append(row)
+                self.processrow(layout, row)
+                if len(self._checkpoints) > pages:
+                    # the row which began the next page, and any
+                    # after it, are left out
+                    self.truncated = 1
+                    del rows[max(1, self._checkpoints[pages][0]):]
+                    break
+        finally:
+            self._checkpoints = None
+
+        self.beginreport(canvas)
+        if self.truncated and self._groupplan is not None:
+            # the plan's totals cover every row, not just those read
+            self._groupplan.sums = None
+        for row in rows:
+            self.processrow(canvas, row)
+        if self.truncated and marker is not None:
+            self.setreference([ marker ])
+            elementlist = marker.generate(self._prevrow)
+            if (self.current_offset + elementlist[0]) >= self.endofpage:
+                self.newpage(canvas, self._prevrow)
+            self.current_offset += self.addtopage(canvas, elementlist)
+        self.endreport(canvas)
+
+    def _finishedpages(self, canvas):
+        pages = canvas.pages
+        canvas.pages = []
+        for ops in pages:
+            # an empty report still ends with a (blank) page,
+            # which isn't one of ours
+            if not self._pages:
+                return
+            page = self._pages.pop(0)
+            page.content = ops
+            yield page
+
+    # generatefile() is a convenience which generates the report
+    # into a new Canvas for the named file and saves it.
+
+    def generatefile(self, filename, pagesize = None, canvasmaker = Canvas):
+        canvas = canvasmaker(filename, pagesize or defaultPageSize)
+        self.generate(canvas)
+        canvas.save()
+
+    # agenerate(), ageneratefile() and aiterpages() are the asyncio
+    # versions of generate(), generatefile() and paginate(); they are
+    # kept in PollyReportsAsync.py, which needs Python 3.7 or later.
+
+    def agenerate(self, canvas, executor = None, chunksize = 100):
+        from PollyReportsAsync import agenerate
+        return agenerate(self, canvas, executor, chunksize)
+
+    def ageneratefile(self, filename, pagesize = None, canvasmaker = Canvas,
+                      executor = None, chunksize = 100):
+        from PollyReportsAsync import ageneratefile
+        return ageneratefile(self, filename, pagesize, canvasmaker,
+            executor, chunksize)
+
+    def aiterpages(self, pagesize = None, executor = None, chunksize = 100):
+        from PollyReportsAsync import aiterpages
+        return aiterpages(self, pagesize, executor, chunksize)
+
+    # generatestreaming() generates the report into the named PDF
+    # file without keeping every page in memory until the end.
+    # Reportlab holds all the pages of a Canvas until save() is
+    # called, so instead the pages are written out in parts of
+    # pagesperpart pages, each saved (and its memory released) as
+    # soon as it is full, and the parts are merged into the final
+    # file at the end.  The merge requires pypdf; without it, the
+    # report is generated into a single Canvas as usual.
+
+    def generatestreaming(self, filename, pagesize = None,
+                          pagesperpart = 100, canvasmaker = Canvas):
+        if PdfReader is None:
+            self.generatefile(filename, pagesize, canvasmaker)
+            return
+        canvas = _PartCanvas(filename, pagesize or defaultPageSize,
+                             pagesperpart, canvasmaker)
+        try:
+            self.generate(canvas)
+            canvas.finish()
+            _mergepdfs(canvas.parts, filename)
+        finally:
+            for part in canvas.parts:
+                if os.path.exists(part):
+                    os.remove(part)
+
+    # generatepipelined() generates the report into the named PDF
+    # file as generatestreaming() does, but in three stages running
+    # at once:  a thread reads rows from the datasource up to
+    # prefetch rows ahead of the report, the report is laid out and
+    # drawn as usual, and another thread saves (that is, compresses
+    # and writes) each part as soon as it is full, while the next is
+    # being drawn.  Each stage blocks when the next one falls behind,
+    # so no more than prefetch rows and two finished parts are held
+    # at once.  An exception in any stage stops the others and is
+    # raised here.  Afterwards, pipelinestats describes where the
+    # time went.  Without pypdf, the pages are all saved at the end
+    # as generatefile() does, but the rows are still prefetched.
+
+    def generatepipelined(self, filename, pagesize = None, prefetch = 1000,
+                          pagesperpart = 100, canvasmaker = Canvas):
+        start = _clock()
+        rows = _Prefetcher(self.datasource, prefetch)
+        writer = _PartWriter()
+        parts = []
+        try:
+            if PdfReader is None:
+                canvas = canvasmaker(filename, pagesize or defaultPageSize)
+            else:
+                canvas = _PartCanvas(filename, pagesize or defaultPageSize,
+                                     pagesperpart, canvasmaker, writer.save)
+                parts = canvas.parts
+            rows.start()
+            writer.start()
+            self.beginreport(canvas)
+            source = rows
+            if self.stats is not None:
+                source = self._timedrows(rows)
+            for row in source:
+                self.processrow(canvas, row)
+            self.endreport(canvas)
+            if PdfReader is None:
+                writer.save(canvas)
+            else:
+                canvas.finish()
+            writer.finish()
+            if parts:
+                _mergepdfs(parts, filename)
+        finally:
+            self._uninstrument()
+            rows.stop()
+            writer.stop()
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+        elapsed = _clock() - start
+        self.pipelinestats = {
+            "rows": rows.count,
+            "seconds": elapsed,
+            "rowspersecond": rows.count / elapsed if elapsed else 0.0,
+            "fetchtime": rows.fetchtime,
+            "fetchblocked": rows.blocked,
+            "layoutwait": rows.waited,
+            "savetime": writer.savetime,
+            "savewait": writer.waited,
+        }
+
+    # generateparallel() renders the report into the named PDF file
+    # using a pool of worker processes.  A layout pass is run first
+    # on a canvas which draws nothing, recording the row and report
+    # state at which each page begins; contiguous ranges of pages
+    # are then rendered in the workers, each restarting the report
+    # from the checkpoint of its first page, and the partial PDFs
+    # are merged in order.
+    #
+    # The datasource is read into a list for the layout pass, and
+    # the workers inherit the Report and the rows by forking, so
+    # lambdas in the bands are fine but this only works where the
+    # "fork" start method is available.  Without pypdf (used for
+    # the merge), or with processes = 1, the report is simply
+    # generated serially into the file.
+    #
+    # Note that onrender handlers are called during the layout pass
+    # and while the workers skip forward to their first page, as
+    # well as during the actual rendering.
+
+    def generateparallel(self, filename, pagesize = None,
+                         processes = None, canvasmaker = Canvas):
+        global _parallel
+
+        if pagesize is None:
+            pagesize = defaultPageSize
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        if processes < 2 or PdfReader is None \
+        or "fork" not in _startmethods():
+            self.generatefile(filename, pagesize, canvasmaker)
+            return
+
+        rows = list(self.datasource)
+        checkpoints = self._layout(rows, pagesize)
+
+        pages = len(checkpoints)
+        if pages == 0:
+            # nothing but the final showPage() was drawn
+            canvas = canvasmaker(filename, pagesize)
+            canvas.showPage()
+            canvas.save()
+            return
+
+        chunk = (pages + processes - 1) // processes
+        tmpdir = tempfile.mkdtemp()
+        try:
+            jobs = []
+            for first in range(1, pages + 1, chunk):
+                jobs.append((first, min(first + chunk - 1, pages),
+                    os.path.join(tmpdir, "part%06d.pdf" % first)))
+            _parallel = (self, rows, checkpoints, pagesize, canvasmaker)
+            try:
+                pool = multiprocessing.get_context("fork").Pool(min(processes, len(jobs)))
+                try:
+                    parts = pool.map(_renderrange, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                _parallel = None
+            _mergepdfs(parts, filename)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors = True)
+
+    # _layout() runs the report over the rows without drawing it,
+    # returning a checkpoint for the start of each page:  the index
+    # of the row being processed when the page began, and the state
+    # of the report (see getstate()) before that row was processed.
+
+    def _layout(self, rows, pagesize):
+        self._checkpoints = []
+        try:
+            canvas = _NullCanvas(pagesize)
+            self.beginreport(canvas)
+            for i in range(len(rows)):
+                self._rowindex = i
+                self._rowstate = self.getstate()
+                self.processrow(canvas, rows[i])
+            self._rowindex = len(rows)
+            self._rowstate = self.getstate()
+            self.endreport(canvas)
+            return self._checkpoints
+        finally:
+            self._uninstrument()
+            self._checkpoints = None
+            self._rowstate = None
+
+    # generateincremental() generates the report into the named file,
+    # reusing whatever pages it can from the previous run, kept in
+    # cachedir.  A layout pass (as for generateparallel()) finds the
+    # pages, and each is given a fingerprint of the report's layout,
+    # the state of the report when the page began, and the rows which
+    # went into it; pages whose fingerprints are found in the cache
+    # are copied from the cached PDF, and the rest are rendered, each
+    # run of them in one go.  The page number is part of the state,
+    # so when the pages shift, the pages after the shift are all
+    # rendered again.  version may be used to describe anything else
+    # the report depends on (see _template()).
+
+    def generateincremental(self, filename, cachedir, pagesize = None,
+                            canvasmaker = Canvas, version = None):
+        global _parallel
+
+        if pagesize is None:
+            pagesize = defaultPageSize
+
+        if PdfReader is None:
+            self.generatefile(filename, pagesize, canvasmaker)
+            self.incrementalstats = dict(pages = self.pagenumber,
+                rendered = self.pagenumber, reused = 0)
+            return
+
+        template = self._template(pagesize, canvasmaker, version)
+        rows = list(self.datasource)
+        checkpoints = self._layout(rows, pagesize)
+
+        pages = len(checkpoints)
+        if pages == 0:
+            canvas = canvasmaker(filename, pagesize)
+            canvas.showPage()
+            canvas.save()
+            self.incrementalstats = dict(pages = 0, rendered = 0, reused = 0)
+            return
+
+        fingerprints = []
+        for page in range(pages):
+            rowindex, state = checkpoints[page]
+            if page + 1 < pages:
+                # the row which starts the next page may also have
+                # printed something (a group footer, say) on this one
+                end = checkpoints[page + 1][0] + 1
+            else:
+                end = len(rows)
+            fingerprints.append(_fingerprint(template,
+                (state, rows[rowindex:end])))
+
+        cachefile = os.path.join(cachedir, "report.pdf")
+        indexfile = os.path.join(cachedir, "pages.json")
+        cached = {}
+        try:
+            stream = open(indexfile)
+            try:
+                index = json.load(stream)
+            finally:
+                stream.close()
+            for page, fingerprint in enumerate(index):
+                if fingerprint is not None:
+                    cached[fingerprint] = page
+        except (IOError, OSError, ValueError):
+            pass
+
+        # each page comes from the cached file, or from the part file
+        # for the run of pages it belongs to; consecutive pages from
+        # the same file are copied together.
+        sources = []
+        tmpdir = tempfile.mkdtemp()
+        try:
+            _parallel = (self, rows, checkpoints, pagesize, canvasmaker)
+            try:
+                page = 0
+                while page < pages:
+                    if fingerprints[page] in cached:
+                        sources.append((cachefile, cached[fingerprints[page]]))
+                        page += 1
+                        continue
+                    first = page
+                    while page < pages and fingerprints[page] not in cached:
+                        page += 1
+                    part = _renderrange((first + 1, page,
+                        os.path.join(tmpdir, "part%06d.pdf" % (first + 1))))
+                    sources.extend((part, i) for i in range(page - first))
+            finally:
+                _parallel = None
+                self._uninstrument()
+            parts = []
+            for name, group in itertools.groupby(sources, lambda source: source[0]):
+                parts.append((name, [ i for name, i in group ]))
+            _mergepdfs(parts, filename)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors = True)
+
+        # the old index goes first, so that an interrupted update
+        # can't pair the new file with it
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        if os.path.exists(indexfile):
+            os.remove(indexfile)
+        shutil.copyfile(filename, cachefile)
+        stream = open(indexfile, "w")
+        try:
+            json.dump(fingerprints, stream)
+        finally:
+            stream.close()
+
+        rendered = len([ source for source in sources if source[0] != cachefile ])
+        self.incrementalstats = dict(pages = pages, rendered = rendered,
+            reused = pages - rendered)
+
+    # _template() describes everything about the report (other than
+    # its data) which affects the output:  the Bands and Elements,
+    # the margins and options, and so on.  Functions are described by
+    # their code, so a change to a getvalue or format function is
+    # noticed, but not a change to anything it refers to; version
+    # should be changed when such things change.
+
+    def _template(self, pagesize, canvasmaker, version):
+        bands = [ self.titleband, self.detailband,
+            self.pageheader, self.pagefooter,
+            self.reportheader, self.reportfooter,
+            self.groupheaders, self.groupfooters ]
+        return _describe((version, tuple(pagesize), canvasmaker,
+            self.topmargin, self.bottommargin, self.leftmargin,
+            self.useforms, self.batching, self.rowfunc, self.pagecount,
+            TextElement.text_conversion, bands))
+
+    # generateburst() splits the datasource into separate documents,
+    # one for each run of rows having the same value of key (or of
+    # getvalue(row)), so the datasource should be sorted on it, and
+    # generates each into its own file, named filename % value, or
+    # filename(value) if filename is callable.  The documents are
+    # generated by a pool of worker processes, which inherit the
+    # Report (compiled for the occasion, if it isn't already) by
+    # forking, so the Bands are only set up once; each document's
+    # rows are sent to its worker, as plain dicts (see _plainrow()),
+    # as it is reached, with no more than a few documents per worker
+    # waiting at a time.  Without the "fork" start method, or with
+    # processes = 1, the documents are simply generated here, one
+    # after another.
+    #
+    # A document which fails, or whose rows can't be sent to a
+    # worker, doesn't stop the others; its file is removed, and the
+    # failure noted in burststats, along with the numbers of
+    # documents and pages and the time taken.
+
+    def generateburst(self, filename, key = None, getvalue = None,
+                      processes = None, pagesize = None,
+                      canvasmaker = Canvas):
+        global _burst
+
+        if getvalue is None:
+            getvalue = itemgetter(key)
+        if pagesize is None:
+            pagesize = defaultPageSize
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if callable(filename):
+            makename = filename
+        else:
+            makename = lambda value: filename % (value,)
+
+        start = _clock()
+        stats = {
+            "documents": 0,
+            "pages": 0,
+            "failures": [],
+        }
+
+        def finished(result):
+            value, name, pages, error = result
+            stats["documents"] += 1
+            stats["pages"] += pages
+            if error is not None:
+                stats["failures"].append((value, name, error))
+
+        # a job which can't be sent to a worker, or whose result can't
+        # be sent back, fails on its own
+        def submit(job):
+            try:
+                return (job, pool.apply_async(_renderdocument, (job,)), None)
+            except Exception:
+                return (job, None, traceback.format_exc())
+
+        def collect(pending):
+            job, result, error = pending
+            if result is not None:
+                try:
+                    finished(result.get())
+                    return
+                except Exception:
+                    error = traceback.format_exc()
+            value, name, rows = job
+            if os.path.exists(name):
+                os.remove(name)
+            finished((value, name, 0, error))
+
+        compiled = self._compiled
+        if not compiled:
+            self.compile()
+        datasource = self.datasource
+        groups = itertools.groupby(datasource, getvalue)
+        _burst = (self, pagesize, canvasmaker)
+        try:
+            if processes < 2 or "fork" not in _startmethods():
+                for value, rows in groups:
+                    finished(_renderdocument((value, makename(value),
+                        list(rows))))
+            else:
+                pool = multiprocessing.get_context("fork").Pool(processes)
+                try:
+                    pending = []
+                    for value, rows in groups:
+                        pending.append(submit((value, makename(value),
+                            [ _plainrow(row) for row in rows ])))
+                        if len(pending) >= processes * 4:
+                            collect(pending.pop(0))
+                    for job in pending:
+                        collect(job)
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            _burst = None
+            self.datasource = datasource
+            if not compiled:
+                self._uncompile()
+
+        stats["seconds"] = elapsed = _clock() - start
+        stats["documentspersecond"] = \
+            stats["documents"] / elapsed if elapsed else 0.0
+        self.burststats = stats
+
+    # generatecombined() splits the datasource into documents just as
+    # generateburst() does, but generates them all onto the one canvas,
+    # one after another, so that the fonts, Images and forms they have
+    # in common are only embedded in the output once.  Each document
+    # begins on a new page, with its own page numbers and totals;
+    # afterwards, documents holds (value, pages) for each of them.
+
+    def generatecombined(self, canvas, key = None, getvalue = None):
+        if getvalue is None:
+            getvalue = itemgetter(key)
+        datasource = self.datasource
+        self.documents = []
+        try:
+            for value, rows in itertools.groupby(datasource, getvalue):
+                self.datasource = rows
+                self.generate(canvas)
+                self.documents.append((value, self.pagenumber))
+        finally:
+            self.datasource = datasource
+
+
+# _PartCanvas is a canvas-like object which passes everything
+# through to a real canvas, but saves the real canvas to its own
+# file (a "part") after every pagesperpart pages and begins a new
+# one, so that no more than pagesperpart pages are ever held in
+# memory.  The next part is not started until something is drawn,
+# so the final showPage() doesn't leave an empty part behind.
+
+class _PartCanvas(object):
+
+    def __init__(self, filename, pagesize, pagesperpart, canvasmaker,
+                 save = None):
+        self._filename = filename
+        self._pagesize = pagesize
+        self._pagesperpart = pagesperpart
+        self._canvasmaker = canvasmaker
+        self._canvas = None
+        self._pages = 0
+        self._save = save
+        self._reportlab = isinstance(canvasmaker, type) \
+            and issubclass(canvasmaker, Canvas)
+        self.parts = []
+
+    def showPage(self):
+        self._current().showPage()
+        self._pages += 1
+        if self._pages >= self._pagesperpart:
+            self.finish()
+
+    def finish(self):
+        if self._canvas is not None:
+            if self._save is not None:
+                self._save(self._canvas)
+            else:
+                self._canvas.save()
+            self._canvas = None
+            self._pages = 0
+
+    def _current(self):
+        if self._canvas is None:
+            name = "%s.part%06d" % (self._filename, len(self.parts))
+            self._canvas = self._canvasmaker(name, self._pagesize)
+            self.parts.append(name)
+        return self._canvas
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+# _Prefetcher and _PartWriter are the first and last stages of
+# Report.generatepipelined().  _Prefetcher reads the datasource on
+# its own thread, passing the rows along in chunks through a queue
+# of limited size; _PartWriter saves each part Canvas given it on
+# its own thread, in order.  Each keeps track of the time it (or
+# the report) spent working and waiting.  An exception raised on
+# either thread is passed back, and raised again on the report's
+# thread, the next time the report reads a row or saves a part.
+
+class _Prefetcher(object):
+
+    chunksize = 100
+
+    def __init__(self, datasource, prefetch):
+        self.datasource = datasource
+        self.queue = queue.Queue(max(1, prefetch // self.chunksize))
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.stopping = False
+        self.count = 0
+        self.fetchtime = 0.0
+        self.blocked = 0.0
+        self.waited = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        try:
+            rows = iter(self.datasource)
+            while 1:
+                start = _clock()
+                chunk = list(itertools.islice(rows, self.chunksize))
+                self.fetchtime += _clock() - start
+                if not chunk:
+                    break
+                if not self.put(chunk):
+                    return
+            self.put(None)
+        except Exception as e:
+            self.put(_StageError(e))
+
+    # put() gives up (returning false) if the report has stopped
+    # reading rows.
+
+    def put(self, item):
+        start = _clock()
+        try:
+            while not self.stopping:
+                try:
+                    self.queue.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self.blocked += _clock() - start
+
+    def __iter__(self):
+        while 1:
+            start = _clock()
+            chunk = self.queue.get()
+            self.waited += _clock() - start
+            if chunk is None:
+                return
+            if isinstance(chunk, _StageError):
+                raise chunk.error
+            self.count += len(chunk)
+            for row in chunk:
+                yield row
+
+    def stop(self):
+        self.stopping = True
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class _PartWriter(object):
+
+    def __init__(self):
+        self.queue = queue.Queue(1)
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.error = None
+        self.savetime = 0.0
+        self.waited = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while 1:
+            canvas = self.queue.get()
+            if canvas is None:
+                return
+            if self.error is not None:
+                continue
+            start = _clock()
+            try:
+                canvas.save()
+            except Exception as e:
+                self.error = e
+            self.savetime += _clock() - start
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def save(self, canvas):
+        self.check()
+        start = _clock()
+        self.queue.put(canvas)
+        self.waited += _clock() - start
+
+    def finish(self):
+        start = _clock()
+        self.queue.put(None)
+        self.thread.join()
+        self.waited += _clock() - start
+        self.check()
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+
+class _StageError(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+# RecordingCanvas is a canvas-like object which records each
+# drawing call as an operation (methodname, args, kwargs) rather
+# than drawing it.  Each call to showPage() closes out the current
+# page; the finished pages are kept in the pages attribute, each
+# a list of operations, and can be drawn on a real canvas later
+# with replay().
+
+class RecordingCanvas(object):
+
+    def __init__(self, pagesize = None):
+        self._pagesize = pagesize or defaultPageSize
+        self.pages = []
+        self.ops = []
+
+    def showPage(self):
+        self.pages.append(self.ops)
+        self.ops = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        def record(*args, **kwargs):
+            self.ops.append((name, args, kwargs or None))
+        # cache the recorder so later calls don't come back here
+        setattr(self, name, record)
+        return record
+
+
+def replay(pages, canvas):
+    for ops in pages:
+        for name, args, kwargs in ops:
+            if kwargs:
+                getattr(canvas, name)(*args, **kwargs)
+            else:
+                getattr(canvas, name)(*args)
+        canvas.showPage()
+
+
+# Page describes a page produced by Report.iterpages():  its
+# number, the values of the group headers at the top of the page,
+# the range of rows (numbered as Report.rownumber) processed while
+# it was being filled, and its content, a list of operations which
+# can be drawn with replay([ page.content ], canvas).
+
+class Page(object):
+
+    def __init__(self, pagenumber, groupvalues, firstrow):
+        self.pagenumber = pagenumber
+        self.groupvalues = groupvalues
+        self.firstrow = firstrow
+        self.lastrow = firstrow
+        self.content = None
+
+
+# generateall() generates each of a sequence of Reports onto the
+# canvas in turn, as separate documents sharing fonts, Images and
+# forms as Report.generatecombined() does, and returns the number of
+# pages in each.
+
+def generateall(reports, canvas):
+    pages = []
+    for report in reports:
+        report.generate(canvas)
+        pages.append(report.pagenumber)
+    return pages
+
+
+# _NullCanvas is a canvas-like object which accepts any drawing
+# call and does nothing with it; it is used for layout passes.
+
+class _NullCanvas(object):
+
+    def __init__(self, pagesize):
+        self._pagesize = pagesize
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _donothing
+
+
+def _donothing(*args, **kwargs):
+    pass
+
+
+# _PageRange wraps a real canvas, discarding everything drawn
+# before the first page of the range and stopping the report
+# (via _EndOfRange) when the last page of the range is done.
+
+class _EndOfRange(Exception):
+    pass
+
+
+class _PageRange(object):
+
+    def __init__(self, canvas, report, first, last):
+        self._canvas = canvas
+        self._report = report
+        self._first = first
+        self._last = last
+        self._pagesize = canvas._pagesize
+        self._reportlab = isinstance(canvas, Canvas)
+        self._informs = 0
+
+    # forms are defined whenever they are first needed, which may be
+    # before the first page, so form definitions (which may be nested)
+    # are always passed through.
+
+    def beginForm(self, *args, **kwargs):
+        self._informs += 1
+        self._canvas.beginForm(*args, **kwargs)
+
+    def endForm(self, *args, **kwargs):
+        self._canvas.endForm(*args, **kwargs)
+        self._informs -= 1
+
+    def hasForm(self, name):
+        return self._canvas.hasForm(name)
+
+    # text and path objects are drawn later, so while muted, these
+    # return objects which ignore everything.
+
+    def beginText(self, *args, **kwargs):
+        if self._report.pagenumber < self._first and not self._informs:
+            return _NullCanvas(None)
+        return self._canvas.beginText(*args, **kwargs)
+
+    def beginPath(self, *args, **kwargs):
+        if self._report.pagenumber < self._first and not self._informs:
+            return _NullCanvas(None)
+        return self._canvas.beginPath(*args, **kwargs)
+
+    def showPage(self):
+        if self._report.pagenumber >= self._last:
+            raise _EndOfRange()
+        if self._report.pagenumber >= self._first:
+            self._canvas.showPage()
+
+    # private attributes (the canvas's current colors and so on) are
+    # always those of the real canvas.
+
+    def __getattr__(self, name):
+        if self._report.pagenumber < self._first and not self._informs \
+        and not name.startswith("_"):
+            return _donothing
+        return getattr(self._canvas, name)
+
+
+# _parallel holds (report, rows, checkpoints, pagesize, canvasmaker)
+# while generateparallel() is running; the worker processes
+# inherit it when the pool forks.
+
+_parallel = None
+
+
+# _burst holds (report, pagesize, canvasmaker) while generateburst()
+# is running, in the same way.
+
+_burst = None
+
+
+def _startmethods():
+    if not hasattr(multiprocessing, "get_all_start_methods"):
+        return []
+    return multiprocessing.get_all_start_methods()
+
+
+def _renderrange(job):
+    first, last, filename = job
+    report, rows, checkpoints, pagesize, canvasmaker = _parallel
+    rowindex, state = checkpoints[first - 1]
+    canvas = canvasmaker(filename, pagesize)
+    pagerange = _PageRange(canvas, report, first, last)
+    try:
+        report.beginreport(pagerange)
+        report.setstate(state)
+        for i in range(rowindex, len(rows)):
+            report.processrow(pagerange, rows[i])
+        report.endreport(pagerange)
+    except _EndOfRange:
         canvas.showPage()
+    finally:
+        report._uninstrument()
+    canvas.save()
+    return filename
+
+
+# _describe() returns a string describing obj (see
+# Report._template()), and _fingerprint() a digest of that along
+# with the given data, or None if the data can't be pickled (in
+# which case the page will never be found in the cache).
+
+_undescribed = ("report", "parent", "previousvalue", "summary")
+
+
+def _describe(obj, inbackground = 0):
+    if isinstance(obj, (list, tuple)):
+        return "[%s]" % ", ".join(_describe(item) for item in obj)
+    if isinstance(obj, Band):
+        return "Band(%s, %s, %s, %r, %s, %r, %r, [%s])" % (
+            _describe(obj.elements), _describe(obj.childbands),
+            _describe(obj.additionalbands), obj.key,
+            _describe(obj._getvalue), obj.newpagebefore, obj.newpageafter,
+            ", ".join(_describe(background, 1)
+                for background in obj.backgrounds))
+    if hasattr(obj, "co_code"):
+        # a code object, such as a lambda among a function's constants
+        return "code(%r, %s, %r)" % (obj.co_code,
+            _describe(obj.co_consts), obj.co_names)
+    function = getattr(obj, "__func__", obj)
+    if hasattr(function, "__code__"):
+        return "%s.%s%s" % (function.__module__, function.__name__,
+            _describe(function.__code__))
+    names = _attributes(obj)
+    if names is not None:
+        # a background's height is worked out afresh every time
+        names = [ name for name in names
+            if name not in _undescribed
+            and not (inbackground and name == "height") ]
+        return "%s(%s)" % (type(obj).__name__, ", ".join("%s=%s"
+            % (name, _describe(getattr(obj, name, None))) for name in names))
+    return repr(obj)
+
+
+# _attributes() returns the sorted names of obj's attributes, both
+# those in its __dict__ and those declared in __slots__ anywhere in
+# its class hierarchy, or
+# None if it has neither (numbers, strings and so on).
+
+def _attributes(obj):
+    if isinstance(obj, type):
+        return None
+    names = set(getattr(obj, "__dict__", ()))
+    slotted = 0
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            slotted = 1
+            if name not in ("__dict__", "__weakref__"):
+                names.add(name)
+    if not names and not slotted and not hasattr(obj, "__dict__"):
+        return None
+    return sorted(names)
+
+
+def _fingerprint(template, data):
+    try:
+        data = pickle.dumps(_frozen(data), 2)
+    except Exception:
+        return None
+    digest = hashlib.md5(template.encode("utf-8"))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+# _frozen() turns rows (and other mappings) into tuples of items,
+# so that a ColumnarRow, say, is pickled as its values rather than
+# along with the whole ColumnarSource.
+
+def _frozen(obj):
+    if isinstance(obj, (list, tuple)):
+        return tuple(_frozen(item) for item in obj)
+    if hasattr(obj, "keys") and hasattr(obj, "__getitem__"):
+        return tuple((key, _frozen(obj[key])) for key in obj.keys())
+    return obj
+
+
+# _plainrow() returns a row which has keys (a sqlite3.Row, or a
+# ColumnarRow, which would take its whole ColumnarSource along) as
+# a plain dict, which can be sent to a worker process cheaply.
+
+def _plainrow(row):
+    if hasattr(row, "keys") and not isinstance(row, dict):
+        return dict((key, row[key]) for key in row.keys())
+    return row
+
+
+# _renderdocument() generates one document for generateburst(),
+# returning (value, filename, pages, error), where error is None or
+# the formatted traceback of the exception which stopped it.
+
+def _renderdocument(job):
+    value, filename, rows = job
+    report, pagesize, canvasmaker = _burst
+    report.datasource = rows
+    try:
+        report.generatefile(filename, pagesize, canvasmaker)
+    except Exception:
+        if os.path.exists(filename):
+            os.remove(filename)
+        return (value, filename, 0, traceback.format_exc())
+    return (value, filename, report.pagenumber, None)
+
+
+# _mergepdfs() concatenates the pages of the part files into a
+# single PDF file; a part may also be given as (filename, pages),
+# to copy only the listed pages (numbered from 0) of that file.  Each
+# object is copied to the output as soon as it is reached from a page
+# (renumbered, but with its stream data untouched), so only one part
+# is ever held in memory, and an object shared by pages of the same
+# file (a font, say) is only copied once; the page tree and catalog
+# are written last, as objects 2 and 1.  The document information
+# (title, author and so on) of the first part is kept, but nothing
+# else from the parts' catalogs (outlines, named destinations, page
+# mode and the like) is carried over.
+
+def _mergepdfs(parts, filename):
+    offsets = [ None, None, None ]
+    kids = ArrayObject()
+    numbering = {}
+    info = None
+    out = open(filename, "wb")
+    try:
+        out.write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+        for i, part in enumerate(parts):
+            pages = None
+            if isinstance(part, tuple):
+                part, pages = part
+            stream = open(part, "rb")
+            try:
+                reader = PdfReader(stream)
+                numbers = numbering.setdefault(part, {})
+                if i == 0 and "/Info" in reader.trailer:
+                    pending = []
+                    copy = _copypdfobject(reader.trailer["/Info"], numbers,
+                        pending, offsets)
+                    offsets.append(None)
+                    info = len(offsets) - 1
+                    _writepdfobject(out, info, copy, offsets)
+                    _copypdfpending(out, pending, numbers, offsets)
+                _copypdfpages(out, reader, kids, offsets, numbers, pages)
+            finally:
+                stream.close()
+        pages = DictionaryObject()
+        pages[NameObject("/Type")] = NameObject("/Pages")
+        pages[NameObject("/Count")] = NumberObject(len(kids))
+        pages[NameObject("/Kids")] = kids
+        _writepdfobject(out, 2, pages, offsets)
+        catalog = DictionaryObject()
+        catalog[NameObject("/Type")] = NameObject("/Catalog")
+        catalog[NameObject("/Pages")] = IndirectObject(2, 0, None)
+        _writepdfobject(out, 1, catalog, offsets)
+        xref = out.tell()
+        out.write(("xref\n0 %d\n0000000000 65535 f \n" % len(offsets)).encode("ascii"))
+        for offset in offsets[1:]:
+            out.write(("%010d 00000 n \n" % offset).encode("ascii"))
+        trailer = "/Size %d /Root 1 0 R" % len(offsets)
+        if info is not None:
+            trailer += " /Info %d 0 R" % info
+        out.write(("trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n"
+            % (trailer, xref)).encode("ascii"))
+    finally:
+        out.close()
+
+
+def _copypdfpages(out, reader, kids, offsets, numbers, pages = None):
+    if pages is None:
+        pages = range(len(reader.pages))
+    for i in pages:
+        page = reader.pages[i]
+        pending = []
+        copy = DictionaryObject()
+        for key, value in page.items():
+            if key != "/Parent":
+                copy[key] = _copypdfobject(value, numbers, pending, offsets)
+        copy[NameObject("/Parent")] = IndirectObject(2, 0, None)
+        offsets.append(None)
+        kids.append(IndirectObject(len(offsets) - 1, 0, None))
+        _writepdfobject(out, len(offsets) - 1, copy, offsets)
+        _copypdfpending(out, pending, numbers, offsets)
+
+
+# _copypdfpending() copies the objects found by _copypdfobject() (and
+# any they refer to in turn).  A stream is given its copied dictionary
+# and written by pypdf itself, so its data, still encoded, goes out
+# exactly as it was read.
+
+def _copypdfpending(out, pending, numbers, offsets):
+    while pending:
+        number, ref = pending.pop()
+        obj = ref.get_object()
+        copy = _copypdfobject(obj, numbers, pending, offsets, 1)
+        if isinstance(obj, StreamObject):
+            obj.update(copy)
+            copy = obj
+        _writepdfobject(out, number, copy, offsets)
+
+
+def _copypdfobject(obj, numbers, pending, offsets, toplevel = 0):
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in numbers:
+            offsets.append(None)
+            numbers[key] = len(offsets) - 1
+            pending.append((numbers[key], obj))
+        return IndirectObject(numbers[key], 0, None)
+    if isinstance(obj, DictionaryObject):
+        copy = DictionaryObject()
+        for key, value in obj.items():
+            # a stream's length is rewritten from its data
+            if not (toplevel and key == "/Length"):
+                copy[key] = _copypdfobject(value, numbers, pending, offsets)
+        return copy
+    if isinstance(obj, ArrayObject):
+        return ArrayObject([ _copypdfobject(value, numbers, pending, offsets)
+            for value in obj ])
+    return obj
+
+
+def _writepdfobject(out, number, obj, offsets):
+    offsets[number] = out.tell()
+    out.write(("%d 0 obj\n" % number).encode("ascii"))
+    obj.write_to_stream(out)
+    out.write(b"\nendobj\n")
 
 
 # end of file.
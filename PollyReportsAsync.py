@@ -0,0 +1,165 @@
+# PollyReports
+# Copyright 2012 Chris Gonnerman
+# All rights reserved.
+#
+# BSD 2-Clause License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.  Redistributions in binary
+# form must reproduce the above copyright notice, this list of conditions and
+# the following disclaimer in the documentation and/or other materials
+# provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+    PollyReportsAsync.py -- asyncio support for PollyReports
+
+    This module needs Python 3.7 or later; PollyReports.py itself
+    still runs on Python 2, so the asyncio versions of the generate
+    methods live here.  They are normally called as methods of the
+    Report, i.e. await rpt.agenerate(canvas), which imports this
+    module as needed.
+"""
+
+import asyncio
+import itertools
+
+from PollyReports import Canvas, RecordingCanvas, defaultPageSize
+
+
+# agenerate() generates the report onto the canvas without blocking
+# the event loop.  The rows are laid out and drawn in chunks of
+# chunksize rows, each in the executor (the loop's default executor,
+# a thread pool, if None), so the loop runs freely while the report
+# is being generated, and gets control back between chunks.  The
+# datasource may be an ordinary iterable, which is then read in the
+# executor as well, or an asynchronous one, which is read on the loop.
+#
+# Instead of a canvas, an async function may be given; each page is
+# then recorded (see RecordingCanvas) and the function is awaited
+# with each page, in order.  Pages are handed on once the chunk of
+# rows which finished them has been processed, so they come in
+# groups, one group per chunk (none, for a chunk which finishes no
+# page); a smaller chunksize delivers them sooner.
+
+async def agenerate(report, canvas, executor = None, chunksize = 100):
+    if callable(canvas) and not hasattr(canvas, "showPage"):
+        async for pages in _generate(report, RecordingCanvas(),
+                executor, chunksize, 1):
+            for page in pages:
+                await canvas(page)
+    else:
+        async for pages in _generate(report, canvas, executor, chunksize, 0):
+            pass
+
+
+async def ageneratefile(report, filename, pagesize = None,
+        canvasmaker = Canvas, executor = None, chunksize = 100):
+    canvas = canvasmaker(filename, pagesize or defaultPageSize)
+    await agenerate(report, canvas, executor, chunksize)
+    await _call(executor, canvas.save)
+
+
+# aiterpages() is an asynchronous iterator over the pages of the
+# report, each recorded as a list of drawing operations as described
+# under Report.paginate(); like agenerate(), it hands on the pages
+# finished by each chunk of rows once the chunk has been processed.
+
+async def aiterpages(report, pagesize = None, executor = None,
+        chunksize = 100):
+    async for pages in _generate(report, RecordingCanvas(pagesize),
+            executor, chunksize, 1):
+        for page in pages:
+            yield page
+
+
+# _generate() does the work, yielding after each chunk of rows the
+# pages finished by it, if record is true (and the canvas is thus a
+# RecordingCanvas of our own), or nothing otherwise.
+#
+# If it is cancelled (or fails, or is closed early), the chunk
+# being processed in the executor is allowed to finish, so the
+# Report isn't still changing after the cancellation; the Report is
+# left as it was after the last row processed (report.getstate()
+# describes it), without endreport() having been called but with
+# any timing wrappers (see ReportStats) taken away, and the
+# datasource's iterator is closed, so a CursorSource (for instance)
+# releases its cursor.  Generating the report again starts over.
+
+async def _generate(report, canvas, executor, chunksize, record):
+    source = report.datasource
+    if hasattr(source, "__aiter__"):
+        rows = source.__aiter__()
+    else:
+        rows = iter(source)
+    try:
+        await _call(executor, report.beginreport, canvas)
+        while 1:
+            if hasattr(rows, "__anext__"):
+                chunk = []
+                try:
+                    while len(chunk) < chunksize:
+                        chunk.append(await rows.__anext__())
+                except StopAsyncIteration:
+                    pass
+            else:
+                chunk = itertools.islice(rows, chunksize)
+            count = await _call(executor, _processrows, report, canvas, chunk)
+            yield _finished(canvas, record)
+            if count < chunksize:
+                break
+        await _call(executor, report.endreport, canvas)
+        yield _finished(canvas, record)
+    finally:
+        report._uninstrument()
+        if hasattr(rows, "aclose"):
+            await rows.aclose()
+        elif hasattr(rows, "close"):
+            rows.close()
+
+
+def _processrows(report, canvas, rows):
+    count = 0
+    for row in rows:
+        report.processrow(canvas, row)
+        count += 1
+    return count
+
+
+def _finished(canvas, record):
+    if not record:
+        return []
+    pages = canvas.pages
+    canvas.pages = []
+    return pages
+
+
+# _call() runs function in the executor.  An executor can't stop a
+# call once it has started, so if the caller is cancelled, _call()
+# waits for the function to return before passing the cancellation on.
+
+async def _call(executor, function, *args):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, function, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not future.done():
+            await asyncio.wait([ future ])
+        raise
+
+
+# end of file.
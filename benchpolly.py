@@ -0,0 +1,377 @@
+# PollyReports
+# Copyright 2012 Chris Gonnerman
+# All rights reserved.
+#
+# BSD 2-Clause License
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.  Redistributions in binary
+# form must reproduce the above copyright notice, this list of conditions and
+# the following disclaimer in the documentation and/or other materials
+# provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+    benchpolly.py -- measure PollyReports performance
+
+    python benchpolly.py memory [rows ...]
+
+        compares the peak RSS of Report.generate() with that of
+        Report.generatestreaming(), running each in its own process;
+        the default row counts are 1000 through 1000000.
+
+    python benchpolly.py allocs [rows]
+
+        uses tracemalloc (Python 3.4 and later) to count the memory
+        blocks and bytes allocated for each row generated by a detail
+        band with a child band and a background, without rendering,
+        both with and without Report.compile(); the default is 10000
+        rows.
+
+    python benchpolly.py suite [--json filename] [--shape name ...] [rows ...]
+
+        times Report.generatefile() on each of the report shapes
+        listed in SHAPES, below, with synthetic data, running each in
+        its own process, and prints the rows and pages per second,
+        peak RSS and size of the output for each; the default row
+        counts are 1000, 100000 and 1000000.  With --json, the results
+        are also written to the named file (along with the Python and
+        Reportlab versions and the platform) so that they can be kept
+        and compared from one release to the next.  --shape (which may
+        be repeated) limits the run to the named shapes.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PollyReports import *
+
+
+def rows(count):
+    # synthetic data; generated lazily so the datasource itself
+    # doesn't add to the memory being measured.
+    for i in range(count):
+        yield {
+            "name": "Customer %07d" % i,
+            "phone": "1-%03d-%03d-%04d" % (i % 1000, (i * 7) % 1000, i % 10000),
+            "amount": (i * 37) % 1000,
+        }
+
+
+def detailreport(count):
+    rpt = Report(rows(count))
+    rpt.detailband = Band([
+        TextElement((36, 0), ("Helvetica", 11), key = "name"),
+        TextElement((200, 0), ("Helvetica", 11), key = "phone"),
+        TextElement((400, 0), ("Helvetica", 11), getvalue = lambda x: x["amount"],
+            format = lambda x: "%d.00" % x, align = "right"),
+    ])
+    rpt.pageheader = Band([
+        TextElement((36, 0), ("Times-Bold", 20), text = "Page Header"),
+        Rule((36, 24), 7.5*72, thickness = 2),
+    ])
+    rpt.pagefooter = Band([
+        TextElement((36, 16), ("Helvetica-Bold", 12), sysvar = "pagenumber",
+            format = lambda x: "Page %d" % x),
+    ])
+    return rpt
+
+
+def bandreport(count):
+    rpt = Report(rows(count))
+    rpt.detailband = Band([
+        TextElement((36, 0), ("Helvetica", 11), key = "name"),
+        TextElement((200, 0), ("Helvetica", 11), key = "phone"),
+        TextElement((400, 0), ("Helvetica", 11), getvalue = lambda x: x["amount"],
+            format = lambda x: "%d.00" % x, align = "right"),
+    ], childbands = [
+        Band([
+            TextElement((72, 0), ("Helvetica", 9), key = "phone"),
+            Rule((72, 10), 300),
+        ]),
+    ], backgrounds = [
+        ShapeElement((36, 0), "rectangle", 7.5*72, colors = [ "white", "lightgrey" ]),
+    ])
+    return rpt
+
+
+# synthetic data for the suite; sorted on region and branch, with
+# a long description for wrapped text.
+
+def grouprows(count):
+    for i in range(count):
+        yield {
+            "region": "Region %d" % (i // 20000),
+            "branch": "Branch %04d" % (i // 250),
+            "name": "Customer %07d" % i,
+            "phone": "1-%03d-%03d-%04d" % (i % 1000, (i * 7) % 1000, i % 10000),
+            "amount": (i * 37) % 1000,
+            "description": " ".join([ "lorem", "ipsum", "dolor", "sit", "amet",
+                "consectetur", "adipiscing", "elit" ][:(i % 8) + 1] * ((i % 5) + 1)),
+        }
+
+
+def detailband(elements = None, **kwargs):
+    return Band([
+        TextElement((36, 0), ("Helvetica", 11), key = "name"),
+        TextElement((200, 0), ("Helvetica", 11), key = "phone"),
+        TextElement((400, 0), ("Helvetica", 11), key = "amount",
+            format = lambda x: "%d.00" % x, align = "right"),
+    ] + (elements or []), **kwargs)
+
+
+def plainshape(count):
+    rpt = detailreport(0)
+    rpt.datasource = grouprows(count)
+    return rpt
+
+
+def groupshape(count):
+    rpt = plainshape(count)
+    rpt.groupheaders = [
+        Band([
+            TextElement((36, 4), ("Helvetica-Bold", 14), key = "region"),
+            Rule((36, 22), 7.5*72),
+        ], key = "region"),
+        Band([
+            TextElement((36, 2), ("Helvetica-Bold", 11), key = "branch"),
+        ], key = "branch"),
+    ]
+    rpt.groupfooters = [
+        Band([
+            Rule((330, 2), 72),
+            TextElement((200, 4), ("Helvetica-Bold", 11), text = "Branch total"),
+            SumElement((400, 4), ("Helvetica-Bold", 11), key = "amount",
+                format = lambda x: "%d.00" % x, align = "right"),
+        ], key = "branch"),
+        Band([
+            Rule((330, 2), 72, thickness = 2),
+            TextElement((200, 4), ("Helvetica-Bold", 12), text = "Region total"),
+            SumElement((400, 4), ("Helvetica-Bold", 12), key = "amount",
+                format = lambda x: "%d.00" % x, align = "right"),
+        ], key = "region", newpageafter = 1),
+    ]
+    rpt.reportfooter = Band([
+        TextElement((200, 4), ("Helvetica-Bold", 12), text = "Grand total"),
+        SumElement((400, 4), ("Helvetica-Bold", 12), key = "amount",
+            format = lambda x: "%d.00" % x, align = "right"),
+    ])
+    return rpt
+
+
+def wrappedshape(count):
+    rpt = plainshape(count)
+    rpt.detailband = Band([
+        TextElement((36, 0), ("Helvetica-Bold", 10), key = "name"),
+        TextElement((160, 0), ("Helvetica", 9), key = "description", width = 250),
+        TextElement((500, 0), ("Helvetica", 10), key = "amount",
+            format = lambda x: "%d.00" % x, align = "right"),
+    ])
+    return rpt
+
+
+def childshape(count):
+    rpt = plainshape(count)
+    rpt.detailband = detailband(childbands = [
+        Band([
+            TextElement((72, 0), ("Helvetica", 9), key = "branch"),
+            TextElement((200, 0), ("Helvetica", 9), key = "region"),
+        ]),
+        Band([
+            Rule((72, 2), 300),
+        ]),
+    ])
+    return rpt
+
+
+def backgroundshape(count):
+    rpt = plainshape(count)
+    rpt.detailband = detailband(backgrounds = [
+        ShapeElement((30, 0), "rectangle", 7.5*72,
+            colors = [ "white", "lightgrey" ]),
+    ])
+    return rpt
+
+
+def imageshape(count):
+    image = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "typewriter.png")
+    rpt = plainshape(count)
+    rpt.detailband = detailband([
+        Image((500, 0), 12, 12, text = image),
+    ])
+    return rpt
+
+
+SHAPES = [
+    ("detail", plainshape),
+    ("groups", groupshape),
+    ("wrapped", wrappedshape),
+    ("childbands", childshape),
+    ("backgrounds", backgroundshape),
+    ("images", imageshape),
+]
+
+
+def peakrss():
+    # ru_maxrss is in kilobytes on Linux, bytes on Mac OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    return rss
+
+
+def child(mode, count):
+    fd, filename = tempfile.mkstemp(suffix = ".pdf")
+    os.close(fd)
+    try:
+        start = time.time()
+        rpt = detailreport(count)
+        if mode == "generate":
+            rpt.generatefile(filename)
+        else:
+            rpt.generatestreaming(filename)
+        elapsed = time.time() - start
+        print("%d %d %.2f %d" % (rpt.pagenumber, peakrss(), elapsed,
+            os.path.getsize(filename)))
+    finally:
+        os.remove(filename)
+
+
+def suitechild(shape, count):
+    fd, filename = tempfile.mkstemp(suffix = ".pdf")
+    os.close(fd)
+    try:
+        rpt = dict(SHAPES)[shape](count)
+        start = time.time()
+        rpt.generatefile(filename)
+        elapsed = time.time() - start
+        print(json.dumps({
+            "shape": shape,
+            "rows": count,
+            "pages": rpt.pagenumber,
+            "seconds": round(elapsed, 3),
+            "rowspersecond": round(count / elapsed, 1),
+            "pagespersecond": round(rpt.pagenumber / elapsed, 1),
+            "peakrsskb": peakrss(),
+            "bytes": os.path.getsize(filename),
+        }))
+    finally:
+        os.remove(filename)
+
+
+def suite(args):
+    import reportlab
+    jsonfile = None
+    shapes = []
+    counts = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--json":
+            jsonfile = args.pop(0)
+        elif arg == "--shape":
+            shapes.append(args.pop(0))
+        else:
+            counts.append(int(arg))
+    shapes = shapes or [ name for name, shape in SHAPES ]
+    counts = counts or [ 1000, 100000, 1000000 ]
+
+    print("%-12s %10s %8s %9s %10s %9s %10s %12s" % ("shape", "rows", "pages",
+        "seconds", "rows/sec", "pages/sec", "peak KB", "bytes"))
+    results = []
+    for count in counts:
+        for shape in shapes:
+            output = subprocess.check_output([ sys.executable, __file__,
+                "suitechild", shape, str(count) ])
+            result = json.loads(output.decode("ascii"))
+            results.append(result)
+            print("%-12s %10d %8d %9.2f %10.0f %9.1f %10d %12d" % (shape, count,
+                result["pages"], result["seconds"], result["rowspersecond"],
+                result["pagespersecond"], result["peakrsskb"], result["bytes"]))
+
+    if jsonfile is not None:
+        with open(jsonfile, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "reportlab": reportlab.Version,
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent = 2, sort_keys = True)
+
+
+def memory(counts):
+    print("%-10s %8s %8s %14s %14s" % ("rows", "pages", "seconds",
+        "generate KB", "streaming KB"))
+    for count in counts:
+        results = {}
+        for mode in ("generate", "streaming"):
+            output = subprocess.check_output([ sys.executable, __file__,
+                "child", mode, str(count) ])
+            results[mode] = output.decode("ascii").split()
+        print("%-10d %8s %8s %14s %14s" % (count,
+            results["streaming"][0], results["streaming"][2],
+            results["generate"][1], results["streaming"][1]))
+
+
+def allocs(count):
+    import tracemalloc
+    data = list(rows(count))
+    print("%-10s %8s %8s" % ("", "blocks", "bytes"))
+    for mode in ("plain", "compiled"):
+        rpt = bandreport(count)
+        if mode == "compiled":
+            rpt.compile()
+        rpt.beginreport(RecordingCanvas())
+        band = rpt.detailband
+        band.generate(data[0])
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        kept = [ band.generate(row) for row in data ]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, "filename")
+        blocks = sum(stat.count_diff for stat in stats)
+        size = sum(stat.size_diff for stat in stats)
+        print("%-10s %8.1f %8.0f" % (mode, float(blocks) / len(kept),
+            float(size) / len(kept)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "child":
+        child(sys.argv[2], int(sys.argv[3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "memory":
+        memory([ int(n) for n in sys.argv[2:] ]
+            or [ 1000, 10000, 100000, 1000000 ])
+    elif len(sys.argv) > 1 and sys.argv[1] == "suitechild":
+        suitechild(sys.argv[2], int(sys.argv[3]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "suite":
+        suite(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "allocs":
+        allocs(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        print(__doc__)
+
+
+# end of file.
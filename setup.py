@@ -43,7 +43,7 @@ setup(
 
     description = "Band-oriented PDF report generation from database query",
     long_description = long_description,
-    py_modules = ["PollyReports"],
+    py_modules = ["PollyReports", "PollyReportsAsync"],
     keywords = "database report",
 
     classifiers = [
@@ -0,0 +1,113 @@
+# helpers shared by the tests:  the path to PollyReports, a standard
+# report to generate, and ways of comparing generated output.
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from reportlab.pdfgen.canvas import Canvas
+
+import PollyReports
+from PollyReports import Band, ColumnarSource, Element, Report, Rule, \
+    SumElement
+
+
+# requirespdf skips the tests which read PDF files back when pypdf
+# isn't installed.
+
+requirespdf = unittest.skipIf(PollyReports.PdfReader is None,
+    "pypdf is required")
+
+
+def makerows(count = 400, groupsize = 40):
+    return [ { "group": "Group %d" % (i // groupsize), "name": "Row %d" % i,
+        "amount": i } for i in range(count) ]
+
+
+# makereport() returns a report of the rows with a page header, a
+# group on "group" with a header and a total in its footer, and a
+# grand total; with no rows, makerows() supplies them.
+
+def makereport(rows = None, title = "Test Report"):
+    if rows is None:
+        rows = makerows()
+    rpt = Report(rows)
+    rpt.pageheader = Band([
+        Element((36, 0), ("Helvetica-Bold", 12), text = title),
+        Element((500, 0), ("Helvetica", 10), sysvar = "pagenumber",
+            format = lambda n: "Page %d" % n),
+        Rule((36, 20), 7.5 * 72),
+    ])
+    rpt.detailband = Band([
+        Element((36, 0), ("Helvetica", 10), key = "name"),
+        Element((400, 0), ("Helvetica", 10), key = "amount", align = "right"),
+    ])
+    rpt.groupheaders = [ Band([
+        Rule((36, 0), 7.5 * 72),
+        Element((36, 4), ("Helvetica-Bold", 10), key = "group"),
+    ], key = "group") ]
+    rpt.groupfooters = [ Band([
+        SumElement((400, 0), ("Helvetica-Bold", 10), key = "amount",
+            align = "right"),
+    ], key = "group") ]
+    rpt.reportfooter = Band([
+        Element((36, 4), ("Helvetica-Bold", 10), text = "Grand Total"),
+        SumElement((400, 4), ("Helvetica-Bold", 10), key = "amount",
+            align = "right"),
+    ])
+    return rpt
+
+
+# columnar() returns the same rows as a ColumnarSource.
+
+def columnar(rows):
+    return ColumnarSource(dict((key, [ row[key] for row in rows ])
+        for key in rows[0]))
+
+
+def memorycanvas(pagesize = None):
+    if pagesize is None:
+        return Canvas(io.BytesIO())
+    return Canvas(io.BytesIO(), pagesize)
+
+
+# pdfcontents() returns the (decoded) content stream of each page of
+# the PDF file, which is what the generate methods must agree on.
+
+def pdfcontents(filename):
+    return [ page.get_contents().get_data()
+        for page in PollyReports.PdfReader(filename).pages ]
+
+
+# texts() returns the text drawn on each page of a page plan (see
+# Report.paginate()), in order.
+
+def texts(pages):
+    return [ [ args[2] for name, args, kwargs in page
+        if name in ("drawString", "drawRightString", "drawCentredString") ]
+            for page in pages ]
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors = True)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    # baseline() generates the report made by factory with plain
+    # generatefile(), returning the contents of its pages.
+
+    def baseline(self, factory, **kwargs):
+        filename = self.path("baseline.pdf")
+        factory().generatefile(filename, **kwargs)
+        return pdfcontents(filename)
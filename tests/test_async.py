@@ -0,0 +1,91 @@
+# tests of the asyncio versions of generate(), generatefile() and
+# paginate(), kept in PollyReportsAsync.py
+
+import asyncio
+
+from helpers import TempDirTestCase, makereport, makerows, memorycanvas, \
+    pdfcontents, requirespdf, texts
+from PollyReports import Element
+
+
+class Failure(Exception):
+    pass
+
+
+# AsyncRows is an asynchronous iterator over the rows, noting whether
+# it was closed.
+
+class AsyncRows(object):
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.closed = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.rows)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def aclose(self):
+        self.closed = 1
+
+
+class AsyncTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        TempDirTestCase.tearDown(self)
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, pages):
+        async def collect():
+            return [ page async for page in pages ]
+        return self.wait(collect())
+
+    @requirespdf
+    def test_ageneratefile(self):
+        filename = self.path("async.pdf")
+        self.wait(makereport().ageneratefile(filename, chunksize = 37))
+        self.assertEqual(pdfcontents(filename), self.baseline(makereport))
+
+    def test_aiterpages(self):
+        expected = makereport().paginate()
+        for chunksize in (1, 37, 1000):
+            pages = self.collect(makereport().aiterpages(chunksize = chunksize))
+            self.assertEqual(pages, expected)
+
+    def test_callback(self):
+        pages = []
+        async def receive(page):
+            pages.append(page)
+        self.wait(makereport().agenerate(receive, chunksize = 50))
+        self.assertEqual(pages, makereport().paginate())
+
+    def test_async_datasource(self):
+        rows = AsyncRows(makerows())
+        pages = self.collect(makereport(rows).aiterpages(chunksize = 30))
+        self.assertEqual(texts(pages), texts(makereport().paginate()))
+        self.assertTrue(rows.closed)
+
+    def test_failure_closes_rows(self):
+        def getvalue(row):
+            if row["amount"] == 250:
+                raise Failure()
+            return row["name"]
+        rows = AsyncRows(makerows())
+        rpt = makereport(rows)
+        rpt.detailband.elements[0] = Element((36, 0), ("Helvetica", 10),
+            getvalue = getvalue)
+        self.assertRaises(Failure, self.wait,
+            rpt.agenerate(memorycanvas(), chunksize = 20))
+        self.assertTrue(rows.closed)
@@ -0,0 +1,152 @@
+# tests that batched drawing (Report.batching) puts everything where
+# unbatched drawing does
+
+import unittest
+
+import PollyReports
+from reportlab.lib.colors import lightgrey, white
+
+from helpers import TempDirTestCase, makereport, pdfcontents, requirespdf
+from PollyReports import ShapeElement
+
+
+# placedtext() returns, for each page of the PDF file, the strings
+# drawn on it, each with its position on the page, font and size.
+
+def placedtext(filename):
+    pages = []
+    for page in PollyReports.PdfReader(filename).pages:
+        items = []
+        def visit(text, cm, tm, font, size):
+            if text.strip():
+                x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                items.append((text, round(x, 2), round(y, 2),
+                    font and font.get("/BaseFont"), size))
+        page.extract_text(visitor_text = visit)
+        pages.append(sorted(items))
+    return pages
+
+
+# placedshapes() returns, for each page of the PDF file, the lines and
+# rectangles drawn on it, in page coordinates, each with whether it
+# was filled, its fill color, and its stroke color and line width (if
+# it was stroked); and the number of times the page was painted.
+
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D,
+        e * A + f * C + E, e * B + f * D + F)
+
+_fills = ("f", "f*", "B", "B*", "b", "b*")
+
+_strokes = ("S", "s", "B", "B*", "b", "b*")
+
+def placedshapes(filename):
+    pages = []
+    for page in PollyReports.PdfReader(filename).pages:
+        matrix = (1, 0, 0, 1, 0, 0)
+        state = { "rg": None, "RG": (0, 0, 0), "w": 1 }
+        saved = []
+        path = []
+        items = []
+        paints = 0
+        def point(x, y):
+            a, b, c, d, e, f = matrix
+            return (round(a * x + c * y + e, 2), round(b * x + d * y + f, 2))
+        for operands, operator in page.get_contents().operations:
+            operator = operator.decode("latin-1")
+            if operator == "q":
+                saved.append((matrix, dict(state)))
+            elif operator == "Q":
+                matrix, state = saved.pop()
+            elif operator == "cm":
+                matrix = _multiply([ float(n) for n in operands ], matrix)
+            elif operator in ("g", "G"):
+                state[operator == "g" and "rg" or "RG"] = \
+                    (round(float(operands[0]), 3),) * 3
+            elif operator in ("rg", "RG"):
+                state[operator] = tuple(round(float(n), 3) for n in operands)
+            elif operator == "w":
+                state["w"] = float(operands[0])
+            elif operator == "re":
+                x, y, width, height = [ float(n) for n in operands ]
+                corners = sorted([ point(x, y), point(x + width, y + height) ])
+                path.append(("rect",) + tuple(corners))
+            elif operator == "m":
+                start = point(*[ float(n) for n in operands ])
+            elif operator == "l":
+                end = point(*[ float(n) for n in operands ])
+                path.append(("line",) + tuple(sorted([ start, end ])))
+            elif operator in _fills or operator in _strokes or operator == "n":
+                filled = operator in _fills
+                stroked = operator in _strokes
+                for item in path:
+                    items.append((item, filled, filled and state["rg"] or None,
+                        stroked and (state["RG"], state["w"]) or None))
+                path = []
+                paints += operator != "n"
+        pages.append((sorted(items, key = repr), paints))
+    return pages
+
+
+# stripedreport() is makereport() with alternating grey and white row
+# backgrounds.
+
+def stripedreport():
+    rpt = makereport()
+    rpt.detailband.elements.insert(0, ShapeElement((0, 0), "rectangle",
+        540, 12, colors = [ lightgrey, white ], stroke = False))
+    return rpt
+
+
+def batchedreport():
+    rpt = makereport()
+    rpt.batching = 1
+    return rpt
+
+
+@requirespdf
+class BatchingTest(TempDirTestCase):
+
+    # generate() generates the report made by factory with and without
+    # batching, returning the names of the two files.
+
+    def generate(self, factory):
+        self.baseline(factory)
+        filename = self.path("batched.pdf")
+        rpt = factory()
+        rpt.batching = 1
+        rpt.generatefile(filename)
+        return filename, self.path("baseline.pdf")
+
+    def test_text(self):
+        batched, baseline = self.generate(makereport)
+        self.assertEqual(placedtext(batched), placedtext(baseline))
+        # one text object a page (after the one Reportlab begins every
+        # page with), where each string had one of its own
+        for contents in pdfcontents(batched):
+            self.assertEqual(contents.count(b"BT"), 2)
+
+    def test_shapes(self):
+        batched, baseline = self.generate(stripedreport)
+        batched, baseline = placedshapes(batched), placedshapes(baseline)
+        self.assertEqual([ shapes for shapes, paints in batched ],
+            [ shapes for shapes, paints in baseline ])
+        self.assertEqual(placedtext(self.path("batched.pdf")),
+            placedtext(self.path("baseline.pdf")))
+        # the grey rows, the white rows and the rules take a fill or a
+        # stroke apiece, where each row had one of its own (the last
+        # page has only the grand total, and its page header's rule)
+        self.assertEqual([ paints for shapes, paints in batched ],
+            [ 3 ] * (len(batched) - 1) + [ 1 ])
+        self.assertTrue(all(paints > 30 for shapes, paints in baseline[:-1]))
+
+    def test_recording(self):
+        # other canvases are drawn on just as before
+        self.assertEqual(batchedreport().paginate(), makereport().paginate())
+
+
+if __name__ == "__main__":
+    unittest.main()
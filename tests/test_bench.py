@@ -0,0 +1,55 @@
+# tests that the benchmark suite in benchpolly.py still runs, on a
+# few rows
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from helpers import TempDirTestCase
+
+# benchpolly.py uses the resource module, which only Unix has
+if sys.platform != "win32":
+    import benchpolly
+else:
+    benchpolly = None
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "benchpolly.py")
+
+
+@unittest.skipIf(benchpolly is None, "benchpolly.py needs Unix")
+class BenchTest(TempDirTestCase):
+
+    # each report shape comes out the same compiled as not, so the
+    # suite times the same output either way.
+
+    def test_shapes(self):
+        for name, shape in benchpolly.SHAPES:
+            pages = shape(300).paginate()
+            self.assertTrue(len(pages) > 1, name)
+            rpt = shape(300)
+            rpt.compile()
+            self.assertEqual(rpt.paginate(), pages, name)
+
+    def test_suite(self):
+        filename = self.path("bench.json")
+        subprocess.check_output([ sys.executable, SCRIPT, "suite",
+            "--json", filename, "--shape", "detail", "--shape", "groups",
+            "50", "100" ])
+        stream = open(filename)
+        try:
+            results = json.load(stream)["results"]
+        finally:
+            stream.close()
+        self.assertEqual([ (result["shape"], result["rows"])
+                for result in results ],
+            [ ("detail", 50), ("groups", 50), ("detail", 100),
+                ("groups", 100) ])
+        self.assertTrue(all(result["pages"] > 0 and result["bytes"] > 0
+            for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# tests for Report.generateburst()
+
+import os
+import sqlite3
+import unittest
+
+from helpers import TempDirTestCase, columnar, makereport, makerows, \
+    pdfcontents, requirespdf
+from PollyReports import Element
+
+
+@requirespdf
+class BurstTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.rows = makerows(120)
+        self.groups = sorted(set(row["group"] for row in self.rows))
+
+    def expected(self, group):
+        filename = self.path("expected.pdf")
+        makereport([ row for row in self.rows
+            if row["group"] == group ]).generatefile(filename)
+        return pdfcontents(filename)
+
+    def burst(self, datasource, processes):
+        rpt = makereport(datasource)
+        rpt.generateburst(self.path("%s.pdf"), key = "group",
+            processes = processes)
+        return rpt
+
+    def check(self, datasource, processes):
+        rpt = self.burst(datasource, processes)
+        self.assertEqual(rpt.burststats["failures"], [])
+        self.assertEqual(rpt.burststats["documents"], len(self.groups))
+        for group in self.groups:
+            self.assertEqual(pdfcontents(self.path(group + ".pdf")),
+                self.expected(group))
+        return rpt
+
+    def test_serial(self):
+        self.check(self.rows, 1)
+
+    def test_processes(self):
+        self.check(self.rows, 2)
+
+    def test_sqlite_rows(self):
+        db = sqlite3.connect(":memory:")
+        db.row_factory = sqlite3.Row
+        db.execute("create table items (grp text, name text, amount integer)")
+        db.executemany("insert into items values (?, ?, ?)",
+            [ (row["group"], row["name"], row["amount"]) for row in self.rows ])
+        rows = db.execute("select grp as 'group', name, amount from items"
+            " order by amount").fetchall()
+        self.check(rows, 2)
+        db.close()
+
+    def test_columnar_rows(self):
+        self.check(columnar(self.rows), 2)
+
+    def test_failure(self):
+        def getvalue(row):
+            if row["group"] == "Group 1":
+                raise ValueError(row["name"])
+            return row["name"]
+        rpt = makereport(self.rows)
+        rpt.detailband.elements[0] = Element((36, 0), ("Helvetica", 10),
+            getvalue = getvalue)
+        rpt.generateburst(self.path("%s.pdf"), key = "group", processes = 2)
+        failures = rpt.burststats["failures"]
+        self.assertEqual([ failure[0] for failure in failures ], [ "Group 1" ])
+        self.assertIn("ValueError", failures[0][2])
+        self.assertFalse(os.path.exists(self.path("Group 1.pdf")))
+        self.assertTrue(os.path.exists(self.path("Group 2.pdf")))
+
+    def test_left_uncompiled(self):
+        rpt = self.check(self.rows, 2)
+        self.assertEqual(rpt._compiled, 0)
+        self.assertTrue(all(band._ops is None for band in rpt.allbands()))
+
+
+if __name__ == "__main__":
+    unittest.main()
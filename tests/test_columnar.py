@@ -0,0 +1,71 @@
+# tests for ColumnarSource and the group plan it allows
+
+import unittest
+
+from helpers import columnar, makereport, makerows, texts
+from PollyReports import Band, Element, SumElement
+
+
+class ColumnarRowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = makerows(5)
+        self.source = columnar(self.rows)
+
+    def test_mapping(self):
+        row = list(self.source)[3]
+        self.assertEqual(row["name"], "Row 3")
+        self.assertEqual(row.index, 3)
+        self.assertIn("amount", row)
+        self.assertNotIn("missing", row)
+        self.assertEqual(len(row), 3)
+        self.assertEqual(sorted(row), [ "amount", "group", "name" ])
+        self.assertEqual(row.get("missing", 1), 1)
+        self.assertEqual(dict((key, row[key]) for key in row), self.rows[3])
+
+    def test_report(self):
+        self.assertEqual(texts(makereport(self.source).paginate()),
+            texts(makereport(self.rows).paginate()))
+
+
+# the group plan's totals must come out exactly as SumElement.summarize()
+# adds them up row by row, whatever the order of the groups.
+
+class GroupPlanTest(unittest.TestCase):
+
+    def makereport(self, rows):
+        rpt = makereport(rows)
+        rpt.groupheaders.insert(0, Band([
+            Element((36, 0), ("Helvetica-Bold", 12), key = "region"),
+        ], key = "region"))
+        rpt.groupfooters.append(Band([
+            SumElement((400, 0), ("Helvetica-Bold", 12), key = "amount",
+                align = "right"),
+        ], key = "region"))
+        return rpt
+
+    def makerows(self, order):
+        rows = makerows(300, 7)
+        for i, row in enumerate(rows):
+            row["region"] = "Region %d" % (i // 50)
+            row["amount"] = None if i % 11 == 0 else i * 0.1
+        return [ rows[i] for i in order(len(rows)) ]
+
+    def check(self, rows):
+        expected = texts(self.makereport(rows).paginate())
+        rpt = self.makereport(columnar(rows))
+        self.assertEqual(texts(rpt.paginate()), expected)
+        self.assertTrue(rpt._groupplan is not None)
+        self.assertTrue(rpt._groupplan.sums is not None)
+
+    def test_sorted(self):
+        self.check(self.makerows(range))
+
+    def test_unsorted(self):
+        # each group appears in several separate runs
+        self.check(self.makerows(lambda count:
+            [ (i * 37) % count for i in range(count) ]))
+
+
+if __name__ == "__main__":
+    unittest.main()
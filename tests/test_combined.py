@@ -0,0 +1,77 @@
+# tests for Report.generatecombined() and generateall()
+
+import unittest
+
+from reportlab.pdfgen.canvas import Canvas
+
+import PollyReports
+from helpers import TempDirTestCase, makereport, makerows, pdfcontents, \
+    requirespdf
+from PollyReports import generateall
+
+
+def grouprows(rows):
+    groups = []
+    for row in rows:
+        if not groups or groups[-1][0]["group"] != row["group"]:
+            groups.append([])
+        groups[-1].append(row)
+    return groups
+
+
+@requirespdf
+class CombinedTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.rows = makerows(120)
+
+    # separately() returns the pages of each group of rows, generated
+    # by itself into a file of its own, one after another.
+
+    def separately(self):
+        pages = []
+        for rows in grouprows(self.rows):
+            pages.extend(self.baseline(lambda: makereport(rows)))
+        return pages
+
+    # fonts() returns the font objects used by each page of the file.
+
+    def fonts(self, filename):
+        return [ sorted(ref.idnum
+            for ref in page["/Resources"]["/Font"].values())
+                for page in PollyReports.PdfReader(filename).pages ]
+
+    def test_combined(self):
+        filename = self.path("combined.pdf")
+        rpt = makereport(self.rows)
+        canvas = Canvas(filename)
+        rpt.generatecombined(canvas, key = "group")
+        canvas.save()
+        self.assertEqual(pdfcontents(filename), self.separately())
+        self.assertEqual(rpt.documents,
+            [ ("Group %d" % i, 1) for i in range(3) ])
+        self.assertIs(rpt.datasource, self.rows)
+        # every document uses the same embedded fonts
+        fonts = self.fonts(filename)
+        self.assertEqual(len(fonts), 3)
+        self.assertTrue(all(used == fonts[0] for used in fonts))
+
+    def test_getvalue(self):
+        rpt = makereport(self.rows)
+        rpt.generatecombined(Canvas(self.path("combined.pdf")),
+            getvalue = lambda row: row["amount"] // 60)
+        self.assertEqual(rpt.documents, [ (0, 2), (1, 2) ])
+
+    def test_generateall(self):
+        filename = self.path("all.pdf")
+        canvas = Canvas(filename)
+        pages = generateall([ makereport(rows)
+            for rows in grouprows(self.rows) ], canvas)
+        canvas.save()
+        self.assertEqual(pages, [ 1, 1, 1 ])
+        self.assertEqual(pdfcontents(filename), self.separately())
+
+
+if __name__ == "__main__":
+    unittest.main()
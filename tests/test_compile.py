@@ -0,0 +1,86 @@
+# tests that compiled reports (Report.compile()) come out exactly as
+# they do uncompiled
+
+import unittest
+
+from helpers import TempDirTestCase, columnar, makereport, makerows, \
+    pdfcontents, requirespdf, texts
+from PollyReports import Band, Element
+
+
+class Upper(Element):
+
+    def gettext(self, row):
+        return Element.gettext(self, row).upper()
+
+
+# fullreport() is makereport() with every kind of alignment, wrapped
+# text, a format, a getvalue function and an Element subclass.
+
+def fullreport(rows = None):
+    rpt = makereport(rows)
+    rpt.detailband.elements.extend([
+        Element((200, 0), ("Helvetica", 8), key = "amount",
+            format = lambda n: "%.2f" % (n / 3.0), align = "center"),
+        Element((250, 0), ("Times-Roman", 8),
+            getvalue = lambda row: "%s of %s" % (row["name"], row["group"]),
+            width = 60),
+        Upper((450, 0), ("Courier", 8), key = "name"),
+        Element((500, 0), ("Courier", 8), key = "amount", align = "align"),
+    ])
+    return rpt
+
+
+def compiledreport(rows = None):
+    rpt = fullreport(rows)
+    rpt.compile()
+    return rpt
+
+
+class CompileTest(TempDirTestCase):
+
+    def test_paginate(self):
+        self.assertEqual(compiledreport().paginate(), fullreport().paginate())
+
+    @requirespdf
+    def test_generatefile(self):
+        filename = self.path("compiled.pdf")
+        compiledreport().generatefile(filename)
+        self.assertEqual(pdfcontents(filename), self.baseline(fullreport))
+
+    def test_columnar(self):
+        rows = makerows()
+        self.assertEqual(compiledreport(columnar(rows)).paginate(),
+            fullreport(rows).paginate())
+
+    def test_subclass(self):
+        pages = texts(compiledreport().paginate())
+        self.assertIn("ROW 0", pages[0])
+
+    # a Band changed after compiling is compiled again when the report
+    # is next generated.
+
+    def test_changed(self):
+        rpt = compiledreport()
+        rpt.paginate()
+        rpt.detailband.elements[0].font = ("Helvetica-Bold", 10)
+        rpt.detailband.elements.append(
+            Element((150, 0), ("Helvetica", 10), text = "added"))
+        expected = fullreport()
+        expected.detailband.elements[0].font = ("Helvetica-Bold", 10)
+        expected.detailband.elements.append(
+            Element((150, 0), ("Helvetica", 10), text = "added"))
+        self.assertEqual(rpt.paginate(), expected.paginate())
+
+    def test_replaced_band(self):
+        rpt = compiledreport()
+        rpt.paginate()
+        rpt.detailband = Band([
+            Element((36, 0), ("Helvetica", 10), key = "group"),
+        ])
+        pages = texts(rpt.paginate())
+        self.assertEqual(pages[0][3:5], [ "Group 0", "Group 0" ])
+
+
+if __name__ == "__main__":
+    unittest.main()
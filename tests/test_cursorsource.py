@@ -0,0 +1,143 @@
+# tests for CursorSource, using an in-memory sqlite3 database
+
+import sqlite3
+import unittest
+
+from helpers import memorycanvas
+from PollyReports import Band, CursorSource, Element, Report
+
+
+# Connection wraps a sqlite3 connection, accepting cursor names as
+# server-side cursor drivers do, and keeping track of its cursors.
+# With refusenames, it refuses named cursors with its DB-API Error,
+# as some drivers do.
+
+class Connection(object):
+
+    Error = sqlite3.Error
+
+    def __init__(self, connection, autocommit = False, refusenames = 0):
+        self.connection = connection
+        self.autocommit = autocommit
+        self.refusenames = refusenames
+        self.names = []
+        self.cursors = []
+
+    def cursor(self, name = None):
+        if name is not None and self.refusenames:
+            raise sqlite3.ProgrammingError("named cursors not supported")
+        self.names.append(name)
+        cursor = Cursor(self.connection.cursor())
+        self.cursors.append(cursor)
+        return cursor
+
+
+class Cursor(object):
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.closed = 0
+
+    def execute(self, *args):
+        return self.cursor.execute(*args)
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def close(self):
+        self.closed = 1
+        self.cursor.close()
+
+
+class CursorSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("create table items (id integer, name text)")
+        self.db.executemany("insert into items values (?, ?)",
+            [ (i, "Item %d" % i) for i in range(25) ])
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_batches(self):
+        source = CursorSource(self.db, "select id, name from items order by id",
+            batchsize = 10)
+        rows = list(source)
+        self.assertEqual(rows[3], { "id": 3, "name": "Item 3" })
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(source.rowsfetched, 25)
+        # 10, 10, 5, and the empty batch which ends the result
+        self.assertEqual(source.fetches, 4)
+        self.assertTrue(source.fetchtime >= 0.0)
+        list(source)
+        self.assertEqual((source.rowsfetched, source.fetches), (25, 4))
+
+    def test_params(self):
+        source = CursorSource(self.db, "select name from items where id < ?",
+            (5,))
+        self.assertEqual([ row["name"] for row in source ],
+            [ "Item %d" % i for i in range(5) ])
+
+    def test_mappings(self):
+        self.db.row_factory = sqlite3.Row
+        rows = list(CursorSource(self.db, "select id, name from items"))
+        self.assertTrue(isinstance(rows[0], sqlite3.Row))
+        self.assertEqual(rows[7]["name"], "Item 7")
+
+    def test_early_close(self):
+        connection = Connection(self.db)
+        source = CursorSource(connection, "select id from items",
+            batchsize = 10)
+        rows = iter(source)
+        next(rows)
+        self.assertEqual(connection.cursors[0].closed, 0)
+        rows.close()
+        self.assertEqual(connection.cursors[0].closed, 1)
+        self.assertEqual(source.fetches, 1)
+
+    def test_concurrent(self):
+        connection = Connection(self.db)
+        source = CursorSource(connection, "select id from items order by id",
+            batchsize = 10)
+        first, second = iter(source), iter(source)
+        pairs = list(zip(first, second))
+        self.assertEqual(list(second), [])
+        self.assertEqual(len(pairs), 25)
+        self.assertTrue(all(a == b for a, b in pairs))
+        self.assertEqual(len(set(connection.names)), 2)
+        self.assertTrue(all(name.startswith("pollyreports")
+            for name in connection.names))
+        self.assertTrue(all(cursor.closed for cursor in connection.cursors))
+
+    def test_refused_name(self):
+        connection = Connection(self.db, refusenames = 1)
+        source = CursorSource(connection, "select id from items")
+        self.assertEqual(len(list(source)), 25)
+        self.assertEqual(connection.names, [ None ])
+
+    def test_autocommit(self):
+        connection = Connection(self.db, autocommit = True)
+        source = CursorSource(connection, "select id from items")
+        self.assertEqual(len(list(source)), 25)
+        self.assertEqual(connection.names, [ None ])
+        connection.autocommit = False
+        list(source)
+        self.assertTrue(connection.names[1].startswith("pollyreports"))
+
+    def test_report(self):
+        rpt = Report(CursorSource(self.db, "select id, name from items",
+            batchsize = 7))
+        rpt.detailband = Band([
+            Element((36, 0), ("Helvetica", 10), key = "name"),
+        ])
+        rpt.generate(memorycanvas())
+        self.assertEqual(rpt.rownumber, 25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# tests for drawing static elements as forms (Report.useforms)
+
+import unittest
+
+import PollyReports
+from helpers import TempDirTestCase, makereport, memorycanvas, pdfcontents, \
+    requirespdf
+from PollyReports import Band, Element, FormRenderer, Report, Rule
+
+
+def formsreport():
+    rpt = makereport()
+    rpt.useforms = 1
+    return rpt
+
+
+class FormTest(unittest.TestCase):
+
+    def setUp(self):
+        self.names = []
+        self.formname = FormRenderer.formname
+
+        def formname(renderer):
+            name = self.formname(renderer)
+            self.names.append(name)
+            return name
+
+        FormRenderer.formname = formname
+
+    def tearDown(self):
+        FormRenderer.formname = self.formname
+
+    def test_named_once(self):
+        rpt = Report([ { "name": "Row %d" % i } for i in range(200) ])
+        rpt.useforms = 1
+        rpt.detailband = Band([
+            Element((36, 0), ("Helvetica", 10), key = "name"),
+            Element((300, 0), ("Helvetica", 10), text = "fixed"),
+            Rule((36, 12), 7.5 * 72),
+        ])
+        canvas = memorycanvas()
+        rpt.generate(canvas)
+        self.assertEqual(len(self.names), 1)
+        self.assertTrue(canvas.hasForm(self.names[0]))
+
+
+
+# a report drawn with forms looks the same as one drawn without, and
+# a canvas which can't hold forms is drawn on just as before.
+
+class OutputTest(TempDirTestCase):
+
+    def extract(self, filename):
+        return [ page.extract_text()
+            for page in PollyReports.PdfReader(filename).pages ]
+
+    @requirespdf
+    def test_same_text(self):
+        filename = self.path("forms.pdf")
+        formsreport().generatefile(filename)
+        self.baseline(makereport)
+        # the page header's title and rule are drawn as a form
+        self.assertIn(b" Do", pdfcontents(filename)[0])
+        self.assertEqual(self.extract(filename),
+            self.extract(self.path("baseline.pdf")))
+
+    def test_recording(self):
+        self.assertEqual(formsreport().paginate(), makereport().paginate())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+# tests for ImageCache
+
+import os
+import unittest
+
+from PIL import Image as PILImage
+
+import PollyReports
+from helpers import TempDirTestCase, requirespdf
+from PollyReports import Band, Image, ImageCache, ImageRenderer, Report
+
+
+# placedimages() returns, for each page of the PDF file, where each
+# image or form was drawn:  the x, y, width and height of the unit
+# square it is drawn into, which is how Reportlab draws an image.
+
+def placedimages(filename):
+    pages = []
+    for page in PollyReports.PdfReader(filename).pages:
+        matrix = (1, 0, 0, 1, 0, 0)
+        saved = []
+        places = []
+        for operands, operator in page.get_contents().operations:
+            if operator == b"q":
+                saved.append(matrix)
+            elif operator == b"Q":
+                matrix = saved.pop()
+            elif operator == b"cm":
+                a, b, c, d, e, f = [ float(n) for n in operands ]
+                A, B, C, D, E, F = matrix
+                matrix = (a * A + b * C, a * B + b * D, c * A + d * C,
+                    c * B + d * D, e * A + f * C + E, e * B + f * D + F)
+            elif operator == b"Do":
+                places.append(tuple(round(n, 2)
+                    for n in (matrix[4], matrix[5], matrix[0], matrix[3])))
+        pages.append(places)
+    return pages
+
+
+class ImageCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.picture = self.path("picture.png")
+
+    def save(self, color, size, mtime):
+        PILImage.new("RGB", size, color).save(self.picture)
+        os.utime(self.picture, (mtime, mtime))
+
+    def test_same_file(self):
+        cache = ImageCache()
+        self.save("red", (4, 4), 1000000000)
+        name = cache.get(self.picture)[0]
+        self.assertEqual(cache.get(self.picture)[0], name)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_replaced_file(self):
+        cache = ImageCache()
+        self.save("red", (4, 4), 1000000000)
+        first = cache.get(self.picture)[0]
+        self.save("blue", (4, 4), 1000000060)
+        second, reader = cache.get(self.picture)
+        self.assertNotEqual(second, first)
+        self.assertEqual(reader.getRGBData()[:3], b"\x00\x00\xff")
+        self.assertEqual(cache.misses, 2)
+
+    def test_discard(self):
+        self.save("red", (40, 40), 1000000000)
+        cache = ImageCache(maxbytes = 16000)
+        cache.get(self.picture)
+        self.save("blue", (60, 60), 1000000000)
+        cache.get(self.picture)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(cache._paths), 1)
+
+
+# a report printing pictures, some from files and some as data,
+# draws them in the same places with the cache as without it.
+
+@requirespdf
+class ReportTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.imagecache = ImageRenderer.imagecache
+        pictures = []
+        for color in ("red", "green"):
+            filename = self.path("%s.png" % color)
+            PILImage.new("RGB", (8, 8), color).save(filename)
+            pictures.append(filename)
+        with open(pictures[1], "rb") as fp:
+            pictures[1] = fp.read()
+        self.rows = [ { "picture": pictures[i % 2] } for i in range(120) ]
+
+    def tearDown(self):
+        ImageRenderer.imagecache = self.imagecache
+        TempDirTestCase.tearDown(self)
+
+    def generate(self, name, cache):
+        ImageRenderer.imagecache = cache
+        rpt = Report(self.rows)
+        rpt.detailband = Band([
+            Image((36, 0), 12, 12, key = "picture"),
+        ])
+        filename = self.path(name)
+        rpt.generatefile(filename)
+        return filename
+
+    def test_same_places(self):
+        cache = ImageCache()
+        cached = self.generate("cached.pdf", cache)
+        uncached = self.generate("uncached.pdf", None)
+        self.assertEqual((cache.hits, cache.misses), (118, 2))
+        self.assertEqual(placedimages(cached), placedimages(uncached))
+        self.assertEqual(sum(len(places)
+            for places in placedimages(cached)), 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# tests for Report.generateincremental()
+
+import unittest
+
+from helpers import TempDirTestCase, makereport, makerows, pdfcontents, \
+    requirespdf
+
+
+@requirespdf
+class IncrementalTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.cachedir = self.path("cache")
+        self.output = self.path("report.pdf")
+
+    def generate(self, rows):
+        rpt = makereport(rows)
+        rpt.generateincremental(self.output, self.cachedir)
+        return rpt.incrementalstats
+
+    def test_unchanged_run_reuses_every_page(self):
+        first = self.generate(makerows())
+        self.assertEqual(first["reused"], 0)
+        self.assertTrue(first["pages"] > 1)
+        second = self.generate(makerows())
+        self.assertEqual(second["pages"], first["pages"])
+        self.assertEqual(second["reused"], second["pages"])
+        self.assertEqual(second["rendered"], 0)
+
+    def test_changed_row_renders_its_pages(self):
+        first = self.generate(makerows())
+        rows = makerows()
+        rows[200]["name"] = "Changed"
+        second = self.generate(rows)
+        self.assertTrue(0 < second["rendered"] < first["pages"])
+
+    def test_output_matches_full_render(self):
+        self.generate(makerows())
+        rows = makerows()
+        rows[100]["amount"] = 12345
+        self.generate(rows)
+        full = self.path("full.pdf")
+        makereport(rows).generatefile(full)
+        self.assertEqual(pdfcontents(self.output), pdfcontents(full))
+
+
+if __name__ == "__main__":
+    unittest.main()
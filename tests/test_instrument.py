@@ -0,0 +1,159 @@
+# tests that ReportStats and measure() leave nothing behind, and of
+# what ReportStats records
+
+import asyncio
+import json
+import unittest
+
+import helpers
+from helpers import memorycanvas
+from PollyReports import Band, Element, Report, ReportStats, TextRenderer
+
+
+class Failure(Exception):
+    pass
+
+
+def makereport(count = 300, failat = None):
+    def getvalue(row):
+        if row["n"] == failat:
+            raise Failure()
+        return "Row %d of a line long enough to need wrapping" % row["n"]
+    rpt = Report([ { "n": i } for i in range(count) ])
+    rpt.detailband = Band([
+        Element((36, 0), ("Helvetica", 10), getvalue = getvalue, width = 100),
+    ])
+    rpt.stats = ReportStats()
+    return rpt
+
+
+class InstrumentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wrapcache = TextRenderer.wrapcache
+
+    def checkclean(self, rpt):
+        self.assertIs(TextRenderer.wrapcache, self.wrapcache)
+        band = rpt.detailband
+        self.assertNotIn("generate", band.__dict__)
+        self.assertNotIn("timed", repr(band.elements[0]._getvalue))
+        self.assertEqual(rpt._instrumented, [])
+
+    def test_finished(self):
+        rpt = makereport()
+        rpt.generate(memorycanvas())
+        self.assertTrue(rpt.stats.timings)
+        self.checkclean(rpt)
+
+    def test_exception(self):
+        rpt = makereport(failat = 100)
+        self.assertRaises(Failure, rpt.generate, memorycanvas())
+        self.checkclean(rpt)
+
+    def test_iterpages_closed(self):
+        rpt = makereport()
+        pages = rpt.iterpages()
+        next(pages)
+        pages.close()
+        self.checkclean(rpt)
+
+    def test_agenerate_failed(self):
+        rpt = makereport(failat = 250)
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertRaises(Failure, loop.run_until_complete,
+                rpt.agenerate(memorycanvas()))
+        finally:
+            loop.close()
+        self.checkclean(rpt)
+
+    def test_measure(self):
+        seen = []
+        rpt = makereport()
+        rpt.stats = None
+        rpt.detailband.elements[0].onrender = \
+            lambda renderer: seen.append(TextRenderer.wrapcache)
+        rpt.measure()
+        rpt.generate(memorycanvas())
+        self.assertTrue(seen)
+        self.assertTrue(all(cache is self.wrapcache for cache in seen))
+        self.checkclean(rpt)
+
+    # two reports run a page at a time, side by side, each with its own
+    # wrapping, come out just as they do one at a time.
+
+    def test_interleaved(self):
+        expected = []
+        for stats in (0, 1):
+            rpt = makereport()
+            if not stats:
+                rpt.stats = None
+                rpt.measure()
+            expected.append(rpt.paginate())
+        first = makereport()
+        first.stats = None
+        first.measure()
+        second = makereport()
+        results = ([], [])
+        for pages in zip(first.iterpages(), second.iterpages()):
+            for result, page in zip(results, pages):
+                result.append(page.content)
+        self.assertEqual(list(results), expected)
+        self.checkclean(first)
+        self.checkclean(second)
+
+
+# tests of what ReportStats records
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rpt = helpers.makereport()
+        self.rpt.stats = ReportStats()
+        self.pages = self.rpt.paginate()
+        self.stats = self.rpt.stats
+
+    def test_same_output(self):
+        self.assertEqual(self.pages, helpers.makereport().paginate())
+
+    def test_timings(self):
+        timings = self.stats.timings
+        self.assertEqual(timings[("datasource",)][0], 401)
+        self.assertEqual(timings[("detailband.generate",)][0], 400)
+        self.assertEqual(timings[("detailband.generate",
+            "detailband.elements[1].format")][0], 400)
+        self.assertEqual(timings[("groupfooters[0].render",)][0], 10)
+        self.assertEqual(timings[("pageheader.generate",)][0], len(self.pages))
+        self.assertEqual(self.stats.pagebreaks, len(self.pages))
+        self.assertTrue(all(seconds >= 0.0
+            for calls, seconds in timings.values()))
+
+    def test_totals(self):
+        totals = self.stats.totals()
+        self.assertEqual(totals["detailband.generate"][0], 400)
+        self.assertEqual(totals["reportfooter.elements[1].format"][0], 1)
+
+    def test_tojson(self):
+        data = json.loads(self.stats.tojson())
+        self.assertEqual(data["pagebreaks"], len(self.pages))
+        self.assertEqual(len(data["timings"]), len(self.stats.timings))
+        self.assertIn({ "stack": [ "detailband.render" ], "calls": 400,
+            "seconds": self.stats.timings[("detailband.render",)][1] },
+            data["timings"])
+
+    def test_collapsed(self):
+        lines = self.stats.collapsed().splitlines()
+        self.assertEqual(len(lines), len(self.stats.timings))
+        stacks = [ line.rsplit(" ", 1)[0] for line in lines ]
+        self.assertIn("report;detailband.generate;"
+            "detailband.elements[0].format", stacks)
+        self.assertTrue(all(int(line.rsplit(" ", 1)[1]) >= 0
+            for line in lines))
+
+    def test_clear(self):
+        self.stats.clear()
+        self.assertEqual((self.stats.timings, self.stats.pagebreaks), ({}, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# tests for Report.iterpages()
+
+import unittest
+
+from reportlab.pdfgen.canvas import Canvas
+
+from helpers import TempDirTestCase, makereport, makerows, pdfcontents, \
+    requirespdf
+from PollyReports import replay
+
+
+# CountedRows counts the rows read from it, and notes whether it was
+# closed.
+
+class CountedRows(object):
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.read = 0
+        self.closed = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self.rows)
+        self.read += 1
+        return row
+
+    next = __next__
+
+    def close(self):
+        self.closed = 1
+
+
+class IterPagesTest(TempDirTestCase):
+
+    def test_content(self):
+        pages = list(makereport().iterpages())
+        self.assertEqual([ page.content for page in pages ],
+            makereport().paginate())
+        self.assertEqual([ page.pagenumber for page in pages ],
+            list(range(1, len(pages) + 1)))
+
+    @requirespdf
+    def test_replay(self):
+        filename = self.path("pages.pdf")
+        canvas = Canvas(filename)
+        for page in makereport().iterpages():
+            replay([ page.content ], canvas)
+        canvas.save()
+        self.assertEqual(pdfcontents(filename), self.baseline(makereport))
+
+    def test_rows(self):
+        pages = list(makereport().iterpages())
+        self.assertEqual(pages[0].firstrow, 1)
+        self.assertEqual(pages[-1].lastrow, 400)
+        for page, following in zip(pages, pages[1:]):
+            # the row which finishes a page begins the next
+            self.assertEqual(page.lastrow, following.firstrow)
+        self.assertEqual(pages[0].groupvalues, [ "Group 0" ])
+        self.assertTrue(all(page.groupvalues[0] is not None
+            for page in pages))
+
+    def test_lazy(self):
+        rows = CountedRows(makerows())
+        pages = makereport(rows).iterpages()
+        self.assertEqual(rows.read, 0)
+        first = next(pages)
+        # the row which began the second page has been read, and no more
+        self.assertEqual(rows.read, first.lastrow)
+        pages.close()
+        self.assertTrue(rows.closed)
+        self.assertEqual(rows.read, first.lastrow)
+
+    def test_empty(self):
+        self.assertEqual(list(makereport([]).iterpages()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
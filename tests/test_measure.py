@@ -0,0 +1,122 @@
+# tests of measure() and the page counts it finds
+
+import unittest
+
+from helpers import TempDirTestCase, makereport, pdfcontents, requirespdf, \
+    texts
+from PollyReports import Band, Element, RecordingCanvas
+
+
+# pagedreport() is makereport() with "Page X of Y" and the pages left
+# (worked out from the page count) in the page header, and the pages
+# of the group in the group header.
+
+def pagedreport():
+    rpt = makereport()
+    rpt.pageheader.elements.extend([
+        Element((300, 0), ("Helvetica", 10), sysvar = "pagecount",
+            format = lambda n: "of %s" % n),
+        Element((36, 36), ("Helvetica", 8),
+            getvalue = lambda row: "%d left" % (rpt.pagecount - rpt.pagenumber)),
+    ])
+    rpt.groupheaders[0].elements.append(Element((300, 4), ("Helvetica", 8),
+        getvalue = lambda row: "%d group pages" % (rpt.grouppagecount + 0)))
+    return rpt
+
+
+class MeasureTest(TempDirTestCase):
+
+    def test_pagecount(self):
+        rpt = pagedreport()
+        count = rpt.measure()
+        self.assertEqual(rpt.pagecount, count)
+        pages = texts(rpt.paginate())
+        self.assertEqual(len(pages), count)
+        for number, page in enumerate(pages):
+            self.assertIn("of %d" % count, page)
+            self.assertIn("%d left" % (count - number - 1), page)
+
+    def test_grouppagecounts(self):
+        rpt = makereport()
+        rpt.groupheaders[0].elements.append(Element((300, 4),
+            ("Helvetica", 8), sysvar = "grouppagecount",
+            format = lambda n: "group of %s" % n))
+        rpt.measure()
+        pages = texts(rpt.paginate())
+        # each group runs from the page with its header to the one with
+        # its footer, which shows its total
+        expected = []
+        for group in range(10):
+            first = [ i for i, page in enumerate(pages)
+                if "Group %d" % group in page ][0]
+            last = [ i for i, page in enumerate(pages)
+                if str(1600 * group + 780) in page ][0]
+            expected.append("group of %d" % (last - first + 1))
+        counts = [ text for page in pages for text in page
+            if text.startswith("group of ") ]
+        self.assertEqual(counts, expected)
+
+    # while measuring, the counts are 0, not None, so that they can be
+    # calculated with.
+
+    def test_while_measuring(self):
+        seen = []
+        rpt = pagedreport()
+        rpt.detailband = Band(rpt.detailband.elements + [
+            Element((450, 0), ("Helvetica", 10), getvalue = lambda row:
+                seen.append((rpt.pagecount, rpt.grouppagecount)) or ""),
+        ])
+        rpt.measure()
+        self.assertEqual(set(seen), set([ (0, 0) ]))
+
+    # the counts found by measure() are used by the next run, and not
+    # by the one after that.
+
+    def test_not_kept(self):
+        rpt = makereport()
+        rpt.pageheader.elements.append(Element((300, 0), ("Helvetica", 10),
+            sysvar = "pagecount", format = lambda n: "of %s" % n))
+        count = rpt.measure()
+        self.assertIn("of %d" % count, texts(rpt.paginate())[0])
+        self.assertEqual(rpt.pagecount, count)
+        self.assertNotIn("of %d" % count, texts(rpt.paginate())[0])
+        self.assertEqual(rpt.pagecount, None)
+        self.assertEqual(rpt._groupspans, None)
+        self.assertEqual(set(rpt.grouppagecounts), set([ None ]))
+
+    # a run cut short (a preview, here) doesn't use them up.
+
+    def test_kept_after_preview(self):
+        rpt = pagedreport()
+        count = rpt.measure()
+        rpt.generatepreview(RecordingCanvas(), pages = 1)
+        self.assertTrue(rpt.truncated)
+        self.assertIn("of %d" % count, texts(rpt.paginate())[0])
+
+    def test_same_output(self):
+        rpt = makereport()
+        rpt.measure()
+        self.assertEqual(rpt.paginate(), makereport().paginate())
+
+    @requirespdf
+    def test_generatefile(self):
+        filename = self.path("measured.pdf")
+        rpt = makereport()
+        self.assertEqual(rpt.measure(), len(self.baseline(makereport)))
+        rpt.generatefile(filename)
+        self.assertEqual(pdfcontents(filename), self.baseline(makereport))
+
+    @requirespdf
+    def test_parallel(self):
+        rpt = pagedreport()
+        rpt.measure()
+        filename = self.path("parallel.pdf")
+        rpt.generateparallel(filename, processes = 2)
+        rpt = pagedreport()
+        rpt.measure()
+        self.assertEqual(pdfcontents(filename),
+            self.baseline(lambda: rpt))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# tests for MemoCache and memoizing Elements
+
+import gc
+import unittest
+import weakref
+
+from helpers import memorycanvas
+from PollyReports import Band, Element, MemoCache, Report
+
+
+def makereport(memoize = 100, format = None):
+    rows = [ { "name": "Row %d" % (i % 10), "amount": i } for i in range(200) ]
+    rpt = Report(rows)
+    rpt.detailband = Band([
+        Element((36, 0), ("Helvetica", 10), key = "name", memoize = memoize,
+            width = 200),
+        Element((400, 0), ("Helvetica", 10), key = "amount", memoize = memoize,
+            format = format or (lambda n: "%d.00" % n)),
+    ])
+    return rpt
+
+
+class MemoCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = Element.memocache
+        self.cache = Element.memocache = MemoCache()
+
+    def tearDown(self):
+        Element.memocache = self.saved
+
+    def generate(self, compiled):
+        rpt = makereport()
+        if compiled:
+            rpt.compile()
+        rpt.generate(memorycanvas())
+        return rpt
+
+    def checkreleased(self, compiled):
+        rpt = self.generate(compiled)
+        self.assertTrue(len(self.cache) > 0)
+        self.assertTrue(self.cache.hits > 0)
+        ref = weakref.ref(rpt)
+        del rpt
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_report_released(self):
+        self.checkreleased(False)
+
+    def test_compiled_report_released(self):
+        self.checkreleased(True)
+
+    def test_clear(self):
+        self.generate(True)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.bytes, 0)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_same_output(self):
+        expected = makereport(0).paginate()
+        for compiled in (0, 1):
+            rpt = makereport()
+            if compiled:
+                rpt.compile()
+            self.assertEqual(rpt.paginate(), expected)
+            self.assertEqual(rpt.paginate(), expected)
+
+    def test_formatted_once(self):
+        calls = []
+        def format(n):
+            calls.append(n)
+            return "%d.00" % (n % 7)
+        rpt = makereport(format = format)
+        rpt.datasource = [ { "name": "Row", "amount": i % 7 }
+            for i in range(100) ] + [ { "name": "Row", "amount": 1.0 } ]
+        rpt.paginate()
+        # 1.0 is remembered apart from 1
+        self.assertEqual(sorted(calls), [ 0, 1, 1.0, 2, 3, 4, 5, 6 ])
+        self.assertEqual(len([ n for n in calls if type(n) is float ]), 1)
+
+    def test_changed_element(self):
+        rpt = makereport()
+        rpt.compile()
+        rpt.paginate()
+        # narrow enough to wrap the names, which were remembered unwrapped
+        rpt.detailband.elements[0].width = 20
+        expected = makereport(0)
+        expected.detailband.elements[0].width = 20
+        self.assertEqual(rpt.paginate(), expected.paginate())
+
+    def test_pure(self):
+        calls = []
+        def getvalue(row):
+            calls.append(row)
+            return row["name"].upper()
+        # whole rows repeat, ten different ones in all
+        rows = [ { "name": "Row %d" % (i % 10), "amount": i % 10 }
+            for i in range(200) ]
+        rpt = makereport()
+        rpt.datasource = rows
+        rpt.detailband.elements[0] = Element((36, 0), ("Helvetica", 10),
+            getvalue = getvalue, memoize = 100, pure = 1)
+        pages = rpt.paginate()
+        self.assertEqual(len(calls), 10)
+        expected = makereport(0)
+        expected.datasource = rows
+        expected.detailband.elements[0] = Element((36, 0), ("Helvetica", 10),
+            getvalue = lambda row: row["name"].upper())
+        self.assertEqual(pages, expected.paginate())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# tests for the merged output of generatestreaming()
+
+import os
+import unittest
+
+from reportlab.pdfgen.canvas import Canvas
+
+import PollyReports
+from helpers import TempDirTestCase, makereport, pdfcontents, requirespdf
+
+
+def canvasmaker(filename, pagesize):
+    canvas = Canvas(filename, pagesize)
+    canvas.setTitle("Merge Test")
+    canvas.setAuthor("PollyReports")
+    return canvas
+
+
+@requirespdf
+class MergeTest(TempDirTestCase):
+
+    def test_streaming(self):
+        expected = self.baseline(makereport, canvasmaker = canvasmaker)
+        merged = self.path("merged.pdf")
+        makereport().generatestreaming(merged, pagesperpart = 2,
+            canvasmaker = canvasmaker)
+        reader = PollyReports.PdfReader(merged, strict = True)
+        self.assertEqual(reader.metadata.title, "Merge Test")
+        self.assertEqual(reader.metadata.author, "PollyReports")
+        self.assertTrue(len(expected) > 2)
+        self.assertEqual(pdfcontents(merged), expected)
+
+    def test_part_sizes(self):
+        expected = self.baseline(makereport)
+        # one page a part, the whole report in one part, and more room
+        # than the report needs
+        for pagesperpart in (1, len(expected), len(expected) + 1):
+            merged = self.path("merged%d.pdf" % pagesperpart)
+            makereport().generatestreaming(merged, pagesperpart = pagesperpart)
+            self.assertEqual(pdfcontents(merged), expected)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), sorted(
+            [ "baseline.pdf" ] + [ "merged%d.pdf" % pagesperpart
+                for pagesperpart in (1, len(expected), len(expected) + 1) ]))
+
+    def test_without_pypdf(self):
+        expected = self.baseline(makereport)
+        reader = PollyReports.PdfReader
+        PollyReports.PdfReader = None
+        try:
+            filename = self.path("single.pdf")
+            makereport().generatestreaming(filename, pagesperpart = 2)
+        finally:
+            PollyReports.PdfReader = reader
+        self.assertEqual(pdfcontents(filename), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+# tests for the page plan:  Report.paginate(), RecordingCanvas and
+# replay()
+
+import pickle
+import unittest
+
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.pdfgen.canvas import Canvas
+
+from helpers import TempDirTestCase, makereport, pdfcontents, requirespdf, \
+    texts
+from PollyReports import RecordingCanvas, replay
+
+
+class PaginateTest(TempDirTestCase):
+
+    @requirespdf
+    def test_replay(self):
+        filename = self.path("replayed.pdf")
+        canvas = Canvas(filename)
+        replay(makereport().paginate(), canvas)
+        canvas.save()
+        self.assertEqual(pdfcontents(filename), self.baseline(makereport))
+
+    def test_generate(self):
+        canvas = RecordingCanvas()
+        makereport().generate(canvas)
+        self.assertEqual(canvas.pages, makereport().paginate())
+        self.assertEqual(canvas.ops, [])
+
+    def test_pickle(self):
+        pages = makereport().paginate()
+        self.assertEqual(pickle.loads(pickle.dumps(pages)), pages)
+
+    def test_pagesize(self):
+        pages = makereport().paginate(landscape(letter))
+        self.assertTrue(len(pages) > len(makereport().paginate()))
+        self.assertEqual(texts(pages)[0][:2], [ "Test Report", "Page 1" ])
+
+    def test_no_rows(self):
+        # the final page is still shown, as generate() shows it
+        self.assertEqual(len(makereport([]).paginate()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
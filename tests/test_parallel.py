@@ -0,0 +1,74 @@
+# tests for Report.generateparallel() and restarting a report from
+# its state (getstate() and setstate())
+
+import unittest
+
+from helpers import TempDirTestCase, makereport, makerows, pdfcontents, \
+    requirespdf, texts
+from PollyReports import RecordingCanvas
+
+
+@requirespdf
+class ParallelTest(TempDirTestCase):
+
+    def check(self, factory, processes):
+        filename = self.path("parallel%d.pdf" % processes)
+        factory().generateparallel(filename, processes = processes)
+        self.assertEqual(pdfcontents(filename), self.baseline(factory))
+
+    def test_processes(self):
+        # 9 pages, split unevenly among the workers
+        for processes in (2, 3, 5):
+            self.check(makereport, processes)
+
+    def test_serial(self):
+        self.check(makereport, 1)
+
+    def test_more_processes_than_pages(self):
+        self.check(lambda: makereport(makerows(30)), 4)
+
+    def test_no_rows(self):
+        self.check(lambda: makereport([]), 2)
+
+
+class StateTest(unittest.TestCase):
+
+    # a report restarted from the state saved partway through carries
+    # on exactly as the original run did:  it finishes the page it was
+    # on (drawn on a fresh page here), and the rest are the same.
+
+    def test_restart(self):
+        rows = makerows()
+        expected = texts(makereport(rows).paginate())
+        rpt = makereport(rows)
+        canvas = RecordingCanvas()
+        rpt.beginreport(canvas)
+        for row in rows[:150]:
+            rpt.processrow(canvas, row)
+        state = rpt.getstate()
+        done = len(canvas.pages)
+
+        rpt = makereport(rows)
+        canvas = RecordingCanvas()
+        rpt.beginreport(canvas)
+        rpt.setstate(state)
+        for row in rows[150:]:
+            rpt.processrow(canvas, row)
+        rpt.endreport(canvas)
+        pages = texts(canvas.pages)
+        self.assertEqual(pages[1:], expected[done + 1:])
+        self.assertEqual(expected[done][-len(pages[0]):], pages[0])
+        self.assertEqual(pages[0][0], "Row 150")
+
+    def test_staged(self):
+        rows = makerows()
+        rpt = makereport(rows)
+        canvas = RecordingCanvas()
+        rpt.beginreport(canvas)
+        for row in rows:
+            rpt.processrow(canvas, row)
+        rpt.endreport(canvas)
+        self.assertEqual(canvas.pages, makereport(rows).paginate())
+
+if __name__ == "__main__":
+    unittest.main()
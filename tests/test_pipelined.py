@@ -0,0 +1,100 @@
+# tests for Report.generatepipelined()
+
+import os
+import threading
+import unittest
+
+from reportlab.pdfgen.canvas import Canvas
+
+import PollyReports
+from helpers import TempDirTestCase, makereport, makerows, pdfcontents, \
+    requirespdf
+from PollyReports import Element
+
+
+class Failure(Exception):
+    pass
+
+
+def failingrows(count):
+    for row in makerows()[:count]:
+        yield row
+    raise Failure()
+
+
+@requirespdf
+class PipelinedTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.threads = threading.active_count()
+
+    # checkclean() checks that the threads have stopped and that only
+    # the expected files are left.
+
+    def checkclean(self, *names):
+        self.assertEqual(threading.active_count(), self.threads)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), sorted(names))
+
+    def test_output(self):
+        expected = self.baseline(makereport)
+        filename = self.path("pipelined.pdf")
+        rpt = makereport()
+        rpt.generatepipelined(filename, prefetch = 7, pagesperpart = 2)
+        self.assertEqual(pdfcontents(filename), expected)
+        stats = rpt.pipelinestats
+        self.assertEqual(stats["rows"], 400)
+        for name in ("seconds", "fetchtime", "fetchblocked", "layoutwait",
+                "savetime", "savewait"):
+            self.assertTrue(stats[name] >= 0.0)
+        self.checkclean("baseline.pdf", "pipelined.pdf")
+
+    def test_without_pypdf(self):
+        expected = self.baseline(makereport)
+        filename = self.path("pipelined.pdf")
+        reader = PollyReports.PdfReader
+        PollyReports.PdfReader = None
+        try:
+            makereport().generatepipelined(filename, prefetch = 7)
+        finally:
+            PollyReports.PdfReader = reader
+        self.assertEqual(pdfcontents(filename), expected)
+
+    def test_datasource_failure(self):
+        rpt = makereport(failingrows(300))
+        self.assertRaises(Failure, rpt.generatepipelined,
+            self.path("failed.pdf"), prefetch = 7, pagesperpart = 2)
+        self.checkclean()
+
+    def test_layout_failure(self):
+        def getvalue(row):
+            if row["amount"] == 300:
+                raise Failure()
+            return row["name"]
+        rpt = makereport()
+        rpt.detailband.elements[0] = Element((36, 0), ("Helvetica", 10),
+            getvalue = getvalue)
+        self.assertRaises(Failure, rpt.generatepipelined,
+            self.path("failed.pdf"), prefetch = 7, pagesperpart = 2)
+        self.checkclean()
+
+    def test_save_failure(self):
+        saved = []
+        def canvasmaker(filename, pagesize):
+            canvas = Canvas(filename, pagesize)
+            def save():
+                saved.append(filename)
+                if len(saved) == 3:
+                    raise Failure()
+                Canvas.save(canvas)
+            canvas.save = save
+            return canvas
+        self.assertRaises(Failure, makereport().generatepipelined,
+            self.path("failed.pdf"), pagesperpart = 2,
+            canvasmaker = canvasmaker)
+        self.assertEqual(len(saved), 3)
+        self.checkclean()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+# tests for Report.generatepreview()
+
+import unittest
+
+from helpers import columnar, makereport, makerows, texts
+from PollyReports import RecordingCanvas
+
+
+def preview(rpt, **kwargs):
+    canvas = RecordingCanvas()
+    rpt.generatepreview(canvas, **kwargs)
+    return canvas.pages
+
+
+class PreviewTest(unittest.TestCase):
+
+    def test_first_pages(self):
+        full = makereport().paginate()
+        rpt = makereport()
+        self.assertEqual(preview(rpt, pages = 2), full[:2])
+        self.assertEqual(rpt.truncated, 1)
+
+    # a report which just fits in the pages asked for isn't truncated.
+
+    def test_exact_pages(self):
+        full = makereport().paginate()
+        for pages, truncated in ((len(full) - 1, 1), (len(full), 0),
+                (len(full) + 1, 0)):
+            rpt = makereport()
+            self.assertEqual(preview(rpt, pages = pages), full[:pages])
+            self.assertEqual(rpt.truncated, truncated)
+
+    # a truncated preview with footers totals only the rows it read,
+    # whether the group totals are planned by column or not.
+
+    def test_footer_totals(self):
+        rows = makerows()
+        expected = texts(preview(makereport(rows), pages = 1, footers = 1))
+        printed = [ text for page in expected for text in page
+            if text.startswith("Row ") ]
+        self.assertTrue(0 < len(printed) < len(rows))
+        self.assertEqual(expected[-1][-2:],
+            [ "Grand Total", str(sum(range(len(printed)))) ])
+        rpt = makereport(columnar(rows))
+        self.assertEqual(texts(preview(rpt, pages = 1, footers = 1)), expected)
+        self.assertEqual(rpt.truncated, 1)
+        self.assertTrue(rpt._groupplan is not None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# tests for Elements and the Renderers they generate
+
+import unittest
+
+from helpers import makereport, memorycanvas, texts
+from PollyReports import Band, Element, Report, Rule
+
+
+class RuleTest(unittest.TestCase):
+
+    def test_attributes(self):
+        rule = Rule((36, 0), 100)
+        rule.note = "user data"
+        element = Element((36, 0), ("Helvetica", 10), text = "x")
+        element.note = "user data"
+        self.assertEqual((rule.note, element.note), ("user data", "user data"))
+
+    def test_generate(self):
+        rule = Rule((36, 5), 100)
+        renderer = rule.generate({})
+        self.assertIsNot(renderer, rule)
+        renderer.applyoffset(20)
+        self.assertEqual(rule.pos, (36, 5))
+        self.assertEqual(rule.generate({}).pos, (36, 5))
+
+    # Rules which differ only in position are drawn as different forms.
+
+    def test_forms(self):
+        canvas = memorycanvas()
+        rpt = Report([ { "name": "Row %d" % i } for i in range(3) ])
+        rpt.useforms = 1
+        rpt.detailband = Band([ Rule((36, 0), 100) ],
+            childbands = [ Band([ Rule((36, 6), 100) ]) ])
+        rpt.generate(canvas)
+        names = [ band._static[1].name for band in rpt.allbands() ]
+        self.assertEqual(len(set(names)), 2)
+
+
+class ChildBandTest(unittest.TestCase):
+
+    def test_children(self):
+        rpt = makereport()
+        rpt.detailband.childbands = [ Band([
+            Element((72, 0), ("Helvetica", 8), key = "name",
+                format = lambda name: "child of " + name),
+            Rule((72, 10), 100),
+        ]) ]
+        pages = texts(rpt.paginate())
+        self.assertEqual(pages[0][3:6], [ "Row 0", "0", "child of Row 0" ])
+
+
+if __name__ == "__main__":
+    unittest.main()
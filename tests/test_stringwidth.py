@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# tests that stringwidth(), stringwidths() and wraptext() agree with
+# Reportlab's stringWidth() and simpleSplit()
+
+import unittest
+
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+
+from helpers import makerows
+from PollyReports import stringwidth, stringwidths, wraptext
+
+FONTS = ("Helvetica", "Helvetica-Bold", "Times-Roman", "Courier")
+
+TEXTS = [ u"", u" ", u"Hello, World", u"café crème brûlée",
+    u"€ 12.50", u"tabs\tand  double  spaces",
+    # outside the fonts' encoding, so measured by Reportlab
+    u"日本語", u"mixed Δ text" ]
+
+
+class StringWidthTest(unittest.TestCase):
+
+    def test_stringwidth(self):
+        for font in FONTS:
+            for size in (7, 10, 11.5):
+                for text in TEXTS:
+                    self.assertEqual(stringwidth(text, font, size),
+                        pdfmetrics.stringWidth(text, font, size))
+
+    def test_bytes(self):
+        self.assertEqual(stringwidth(u"café".encode("utf8"), "Helvetica", 10),
+            pdfmetrics.stringWidth(u"café", "Helvetica", 10))
+
+    def test_stringwidths(self):
+        # enough strings to be measured all at once, where NumPy is
+        # available, and a short list measured one at a time
+        texts = [ row["name"] for row in makerows(100) ] + TEXTS
+        for font in FONTS:
+            for chosen in (texts, texts[:5]):
+                self.assertEqual(stringwidths(chosen, font, 10),
+                    [ pdfmetrics.stringWidth(text, font, 10)
+                        for text in chosen ])
+
+    def test_wraptext(self):
+        text = (u"The quick brown fox jumps over the lazy dog; "
+            u"café crème brûlée, twice over.\n"
+            u"A second paragraph with averyveryverylongwordindeed in it.")
+        for font in FONTS:
+            for width in (30, 72, 150, 400):
+                self.assertEqual(wraptext(text, font, 10, width),
+                    simpleSplit(text, font, 10, width))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# tests for WrapCache, which remembers wrapped text
+
+import unittest
+
+from helpers import texts
+from PollyReports import Band, Element, Report, TextRenderer, WrapCache, \
+    wraptext
+
+FONT = ("Helvetica", 10)
+
+TEXT = "a line of text long enough to need wrapping at the width given"
+
+
+class WrapCacheTest(unittest.TestCase):
+
+    def test_split(self):
+        cache = WrapCache()
+        lines = cache.split(TEXT, FONT, 100)
+        self.assertEqual(lines, wraptext(TEXT, FONT[0], FONT[1], 100))
+        self.assertTrue(len(lines) > 1)
+        self.assertEqual(cache.split(TEXT, FONT, 100), lines)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # the font and width are part of the key
+        cache.split(TEXT, FONT, 150)
+        cache.split(TEXT, ("Helvetica-Bold", 10), 100)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 3))
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_least_recently_used(self):
+        cache = WrapCache(2)
+        for text in ("a", "b", "a", "c", "a", "b"):
+            cache.split(text, FONT, 100)
+        # "b" was discarded to make room for "c", and "c" for "b"
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        self.assertEqual(len(cache), 2)
+
+    def test_sizes(self):
+        cache = WrapCache(0)
+        cache.split(TEXT, FONT, 100)
+        cache.split(TEXT, FONT, 100)
+        self.assertEqual((cache.hits, len(cache)), (0, 0))
+        cache = WrapCache(None)
+        for i in range(3000):
+            cache.split("Row %d" % i, FONT, 100)
+        self.assertEqual(len(cache), 3000)
+
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wrapcache = TextRenderer.wrapcache
+
+    def tearDown(self):
+        TextRenderer.wrapcache = self.wrapcache
+
+    def makereport(self):
+        rpt = Report([ { "text": "%s %d" % (TEXT, i % 5) }
+            for i in range(200) ])
+        rpt.detailband = Band([
+            Element((36, 0), FONT, key = "text", width = 100),
+        ])
+        return rpt
+
+    def test_same_output(self):
+        TextRenderer.wrapcache = None
+        expected = self.makereport().paginate()
+        TextRenderer.wrapcache = WrapCache(5)
+        pages = self.makereport().paginate()
+        self.assertEqual(pages, expected)
+        self.assertTrue(TextRenderer.wrapcache.hits > 0)
+        self.assertTrue(len(texts(pages)[0]) > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()